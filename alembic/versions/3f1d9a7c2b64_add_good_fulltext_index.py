@@ -0,0 +1,27 @@
+"""Add good fulltext index
+
+Revision ID: 3f1d9a7c2b64
+Revises: 520dbcc7bbe9
+Create Date: 2026-10-18 16:50:12.403117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1d9a7c2b64'
+down_revision: Union[str, None] = '520dbcc7bbe9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_good_name_description_ft', 'good', ['name', 'description'], unique=False,
+                    mysql_prefix='FULLTEXT', mysql_with_parser='ngram')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_good_name_description_ft', table_name='good')
@@ -0,0 +1,35 @@
+"""Add listing keyset indexes
+
+Revision ID: 7a2e5c913d08
+Revises: 3f1d9a7c2b64
+Create Date: 2026-10-18 17:20:41.218305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a2e5c913d08'
+down_revision: Union[str, None] = '3f1d9a7c2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_good_store_id_created_at', 'good', ['store_id', 'created_at'], unique=False)
+    op.create_index('ix_order_user_id_created_at', 'order', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_order_item_good_id_created_at', 'order_item', ['good_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    # MySQL drops the implicit foreign key indexes once these cover the same leading column,
+    # so put single-column ones back before dropping them.
+    op.create_index('store_id', 'good', ['store_id'], unique=False)
+    op.create_index('user_id', 'order', ['user_id'], unique=False)
+    op.create_index('good_id', 'order_item', ['good_id'], unique=False)
+    op.drop_index('ix_order_item_good_id_created_at', table_name='order_item')
+    op.drop_index('ix_order_user_id_created_at', table_name='order')
+    op.drop_index('ix_good_store_id_created_at', table_name='good')
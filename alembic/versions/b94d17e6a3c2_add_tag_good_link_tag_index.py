@@ -0,0 +1,28 @@
+"""Add tag_good_link tag index
+
+Revision ID: b94d17e6a3c2
+Revises: 7a2e5c913d08
+Create Date: 2026-10-18 17:42:09.731552
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b94d17e6a3c2'
+down_revision: Union[str, None] = '7a2e5c913d08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_tag_good_link_tag_id_good_id', 'tag_good_link', ['tag_id', 'good_id'], unique=False)
+
+
+def downgrade() -> None:
+    # Restore the implicit foreign key index MySQL dropped in favour of the composite one.
+    op.create_index('tag_id', 'tag_good_link', ['tag_id'], unique=False)
+    op.drop_index('ix_tag_good_link_tag_id_good_id', table_name='tag_good_link')
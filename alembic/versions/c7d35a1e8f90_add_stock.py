@@ -0,0 +1,30 @@
+"""Add stock
+
+Revision ID: c7d35a1e8f90
+Revises: e2f06b5d8a41
+Create Date: 2026-10-18 19:12:05.337410
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d35a1e8f90'
+down_revision: Union[str, None] = 'e2f06b5d8a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('good', sa.Column('stock', sa.Integer(), nullable=True))
+    op.add_column('good_style', sa.Column('stock', sa.Integer(), nullable=True))
+    op.add_column('order', sa.Column('expires_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('order', 'expires_at')
+    op.drop_column('good_style', 'stock')
+    op.drop_column('good', 'stock')
@@ -0,0 +1,30 @@
+"""Add good facet indexes
+
+Revision ID: e2f06b5d8a41
+Revises: b94d17e6a3c2
+Create Date: 2026-10-18 18:03:27.904116
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2f06b5d8a41'
+down_revision: Union[str, None] = 'b94d17e6a3c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_good_store_id_price', 'good', ['store_id', 'price'], unique=False)
+    op.create_index('ix_good_price_id', 'good', ['price', 'id'], unique=False)
+    op.create_index('ix_good_created_at_id', 'good', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_good_created_at_id', table_name='good')
+    op.drop_index('ix_good_price_id', table_name='good')
+    op.drop_index('ix_good_store_id_price', table_name='good')
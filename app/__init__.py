@@ -1,8 +1,10 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi_pagination import add_pagination
 from fastapi.middleware.cors import CORSMiddleware
 
-from config import api_root, enable_doc, allow_origins
+from config import api_root, enable_doc, allow_origins, ORDER_INTAKE_ENABLED
 from .auth import auth_router
 from app.routers.user import address_router, user_router
 from app.routers.store import store_router, store_good_router
@@ -11,7 +13,11 @@ from app.routers.order import order_router
 from app.routers.pay import pay_router
 from app.routers.banner import banner_router
 from app.routers.notification import notif_router
+from app.routers.metrics import metrics_router
 from app.utils.file_utils import file_router
+from app.utils.query_stats import QueryStatsMiddleware
+from app.services import user_cache, hashing, random_pool, suggest, recommend, stock, order_intake
+from app.db import async_redis_pool, replica_router
 
 
 app_kwargs = {}
@@ -19,7 +25,30 @@ if not enable_doc:
     app_kwargs |= {"docs_url": None, "redoc_url": None, "openapi_url": None}
 
 
-app = FastAPI(root_path=api_root, root_path_in_servers=True, **app_kwargs)
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    user_cache.start_listener()
+    replica_router.start()
+    random_pool.start_refresher()
+    suggest.start_refresher()
+    recommend.start_refresher()
+    stock.start_reconciler()
+    if ORDER_INTAKE_ENABLED:
+        order_intake.start_consumers()
+    yield
+    order_intake.stop_consumers()
+    stock.stop_reconciler()
+    recommend.stop_refresher()
+    suggest.stop_refresher()
+    random_pool.stop_refresher()
+    replica_router.stop()
+    user_cache.stop_listener()
+    hashing.shutdown()
+    await order_intake.stop_listener()
+    await async_redis_pool.disconnect()
+
+
+app = FastAPI(root_path=api_root, root_path_in_servers=True, lifespan=lifespan, **app_kwargs)
 add_pagination(app)
 app.add_middleware(
     CORSMiddleware,
@@ -27,7 +56,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(QueryStatsMiddleware)
 
 app.include_router(auth_router)
 app.include_router(address_router)
@@ -40,4 +71,5 @@ app.include_router(order_router)
 app.include_router(pay_router)
 app.include_router(banner_router)
 app.include_router(notif_router)
+app.include_router(metrics_router)
 app.include_router(file_router)
@@ -1,3 +1,5 @@
+import hashlib
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
 
@@ -5,17 +7,20 @@ import sqlalchemy.exc
 from fastapi import Depends, HTTPException, status, APIRouter
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
 
-from .db import get_session
+from .db import get_session, get_async_session
 from .models.user import User, Role
 from .models.store import Store
 from .schemas.user import UserCreate, UserRead, UserUpdate
-from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, api_root
+from .services import user_cache, hashing
+from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, TOKEN_CACHE_MAX_SIZE, api_root
+from .utils.cache_utils import TTLCache
 from .utils.log_utils import logger
 
 
@@ -25,24 +30,25 @@ class Token(BaseModel):
     role: int
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{api_root}/auth/jwt/login")
 
 auth_router = APIRouter(prefix="/auth", tags=["鉴权"])
 
+# Decoded claims keyed by the token's sha256 digest, so signature verification happens once per token per worker.
+_token_cache = TTLCache(TOKEN_CACHE_MAX_SIZE, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    return await hashing.verify_password(plain_password, hashed_password)
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await hashing.hash_password(password)
 
 
-def authenticate_user(username: str, password: str, db: Session):
-    user = db.execute(select(User).where(User.username == username)).scalar_one_or_none()
-    if not user or not verify_password(password, user.hashed_password):
+async def authenticate_user(username: str, password: str, db: AsyncSession):
+    user = (await db.execute(select(User).where(User.username == username))).scalar_one_or_none()
+    if not user or not await verify_password(password, user.hashed_password):
         return False
     return user
 
@@ -58,29 +64,42 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     return encoded_jwt
 
 
-async def current_user(token: Annotated[str, Depends(oauth2_scheme)],
-                       db: Annotated[Session, Depends(get_session)]) -> User:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
+
+
+def decode_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode()).digest()
+    payload = _token_cache.get(key)
+    if payload is None:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        exp = payload.get("exp")
+        _token_cache.set(key, payload, time.monotonic() + exp - time.time() if exp else None)
+    return payload
+
+
+def token_cache_stats() -> dict:
+    return _token_cache.stats()
+
+
+def decode_user_id(token: str) -> int:
+    try:
+        payload = decode_token(token)
         user_id: int = payload.get("id")
         if user_id is None:
             logger.error(f"current_user: failed to get user_id from token")
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError as e:
         logger.error(f"current_user: failed to decode jwt", exc_info=e)
-        raise credentials_exception
-    user = db.get(User, user_id)
-    if user is None:
-        raise credentials_exception
-    return user
+        raise _credentials_exception()
+    return user_id
 
 
-async def current_superuser(user: Annotated[User, Depends(current_user)]) -> User:
+def _check_superuser(user: User) -> User:
     if user.role != Role.Admin:
         logger.warn(f"auth: permission denied: {user}")
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
@@ -88,49 +107,100 @@ async def current_superuser(user: Annotated[User, Depends(current_user)]) -> Use
     return user
 
 
-async def current_store(user: Annotated[User, Depends(current_user)], db: Session = Depends(get_session)) -> Store:
-    store = db.execute(
-        select(Store).where(Store.owner_id == user.id).order_by(Store.created_at.desc())
-    ).scalar_one_or_none()
+def _store_query(user: User):
+    return select(Store).where(Store.owner_id == user.id).order_by(Store.created_at.desc())
+
+
+def _check_store(store: Store | None) -> Store:
     if not store:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You don't have any store.")
     return store
 
 
-def create_user(user_dict: UserCreate, db: Session) -> UserRead:
+# Async variants: for `async def` routes. The user lookup goes through aiomysql and never blocks the event loop.
+async def current_user(token: Annotated[str, Depends(oauth2_scheme)],
+                       db: Annotated[AsyncSession, Depends(get_async_session)]) -> User:
+    user_id = decode_user_id(token)
+    user = user_cache.get_user(user_id)
+    if user is not None:
+        return await db.merge(user, load=False)
+    user = await db.get(User, user_id)
+    if user is None:
+        raise _credentials_exception()
+    user_cache.set_user(user)
+    return user
+
+
+async def current_superuser(user: Annotated[User, Depends(current_user)]) -> User:
+    return _check_superuser(user)
+
+
+async def current_store(user: Annotated[User, Depends(current_user)],
+                        db: Annotated[AsyncSession, Depends(get_async_session)]) -> Store:
+    store = (await db.execute(_store_query(user))).scalar_one_or_none()
+    return _check_store(store)
+
+
+# Sync variants: for plain `def` routes. FastAPI runs them in the threadpool, and they share
+# the request's `get_session` session with the route.
+def current_user_sync(token: Annotated[str, Depends(oauth2_scheme)],
+                      db: Annotated[Session, Depends(get_session)]) -> User:
+    user_id = decode_user_id(token)
+    user = user_cache.get_user(user_id)
+    if user is not None:
+        return db.merge(user, load=False)
+    user = db.get(User, user_id)
+    if user is None:
+        raise _credentials_exception()
+    user_cache.set_user(user)
+    return user
+
+
+def current_superuser_sync(user: Annotated[User, Depends(current_user_sync)]) -> User:
+    return _check_superuser(user)
+
+
+def current_store_sync(user: Annotated[User, Depends(current_user_sync)],
+                       db: Annotated[Session, Depends(get_session)]) -> Store:
+    store = db.execute(_store_query(user)).scalar_one_or_none()
+    return _check_store(store)
+
+
+async def create_user(user_dict: UserCreate, db: AsyncSession) -> UserRead:
     user = User(**user_dict.model_dump(exclude={'password'}),
-                hashed_password=get_password_hash(user_dict.password))
+                hashed_password=await get_password_hash(user_dict.password))
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     user_model = UserRead.model_validate(user)
     return user_model
 
 
 @auth_router.post("/register")
-def register(user_dict: UserCreate, db: Session = Depends(get_session)) -> UserRead:
+async def register(user_dict: UserCreate, db: AsyncSession = Depends(get_async_session)) -> UserRead:
     try:
-        return create_user(user_dict, db)
+        return await create_user(user_dict, db)
     except sqlalchemy.exc.IntegrityError as e:
         logger.warn(f"register: probably username duplication", exc_info=e)
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Duplicate username.")
 
 
 @auth_router.post("/register_superuser", dependencies=[Depends(current_superuser)])
-def register_superuser(user_dict: UserCreate, db: Session = Depends(get_session)) -> UserRead:
-    user_schema = create_user(user_dict, db)
-    db.execute(update(User).where(User.id == user_schema.id).values(role=Role.Admin))
-    db.commit()
+async def register_superuser(user_dict: UserCreate, db: AsyncSession = Depends(get_async_session)) -> UserRead:
+    user_schema = await create_user(user_dict, db)
+    await db.execute(update(User).where(User.id == user_schema.id).values(role=Role.Admin))
+    await db.commit()
+    await run_in_threadpool(user_cache.invalidate_user, user_schema.id)
     user_schema.role = Role.Admin
     return user_schema
 
 
 @auth_router.post("/jwt/login")
-def login_for_access_token(
+async def login_for_access_token(
     user_dict: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ) -> Token:
-    user = authenticate_user(user_dict.username, user_dict.password, db)
+    user = await authenticate_user(user_dict.username, user_dict.password, db)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -145,22 +215,23 @@ def login_for_access_token(
 
 
 @auth_router.get("/me")
-def read_users_me(user: Annotated[User, Depends(current_user)]) -> UserRead:
+def read_users_me(user: Annotated[User, Depends(current_user_sync)]) -> UserRead:
     return UserRead.model_validate(user)
 
 
 @auth_router.patch("/me")
-def update_users_me(user_dict: UserUpdate, user: User = Depends(current_user),
-                    db: Session = Depends(get_session)) -> UserRead:
+async def update_users_me(user_dict: UserUpdate, user: User = Depends(current_user),
+                          db: AsyncSession = Depends(get_async_session)) -> UserRead:
     if user_dict.password is not None:
-        hashed_password = get_password_hash(user_dict.password)
+        hashed_password = await get_password_hash(user_dict.password)
         query = (update(User).where(User.id == user.id)
                  .values(hashed_password=hashed_password,
                          **user_dict.model_dump(exclude={"password"}, exclude_none=True)))
     else:
         query = (update(User).where(User.id == user.id)
                  .values(**user_dict.model_dump(exclude={"password"}, exclude_none=True)))
-    db.execute(query)
-    db.commit()
-    user = db.get(User, user.id)
+    await db.execute(query)
+    await db.commit()
+    await run_in_threadpool(user_cache.invalidate_user, user.id)
+    await db.refresh(user)
     return UserRead.model_validate(user)
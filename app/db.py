@@ -3,9 +3,17 @@ from typing import AsyncGenerator, Generator
 from sqlalchemy import create_engine
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session
-from redis import Redis
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from redis import Redis, ConnectionPool
+from redis import asyncio as aioredis
 
-from config import user, password, host, db_name, redis_host, redis_port
+from app.utils.pool_utils import timed_pool_class, instrument_engine
+from app.utils.replica_utils import ReplicaRouter
+from app.utils.query_stats import instrument_queries
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, \
+    DB_REPLICAS, DB_REPLICA_MAX_LAG, DB_REPLICA_CHECK_INTERVAL
+from config import user, password, host, db_name, redis_host, redis_port, redis_max_connections, \
+    redis_socket_timeout, redis_socket_connect_timeout, redis_health_check_interval
 
 DATABASE_URL = f"mysql+pymysql://{user}:{password}@{host}/{db_name}"
 DATABASE_URL_ASYNC = f"mysql+aiomysql://{user}:{password}@{host}/{db_name}"
@@ -13,10 +21,40 @@ REDIS_HOST = redis_host
 REDIS_PORT = redis_port
 
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-async_engine = create_async_engine(DATABASE_URL_ASYNC, pool_pre_ping=True)
+_engine_kwargs = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+engine = create_engine(DATABASE_URL, poolclass=timed_pool_class(QueuePool, "primary"), **_engine_kwargs)
+async_engine = create_async_engine(DATABASE_URL_ASYNC,
+                                   poolclass=timed_pool_class(AsyncAdaptedQueuePool, "primary_async"), **_engine_kwargs)
+instrument_engine(engine, "primary")
+instrument_engine(async_engine.sync_engine, "primary_async")
+read_engines = []
+for i, replica_host in enumerate(DB_REPLICAS):
+    read_engines.append(create_engine(f"mysql+pymysql://{user}:{password}@{replica_host}/{db_name}",
+                                      poolclass=timed_pool_class(QueuePool, f"replica_{i}"), **_engine_kwargs))
+    instrument_engine(read_engines[-1], f"replica_{i}")
+for e in [engine, *read_engines]:
+    instrument_queries(e)
+instrument_queries(async_engine.sync_engine, explain_engine=engine)
+replica_router = ReplicaRouter(engine, read_engines, DB_REPLICA_MAX_LAG, DB_REPLICA_CHECK_INTERVAL)
 async_session_maker = async_sessionmaker(async_engine, expire_on_commit=False)
 
+_redis_pool_kwargs = dict(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    max_connections=redis_max_connections,
+    socket_timeout=redis_socket_timeout,
+    socket_connect_timeout=redis_socket_connect_timeout,
+    health_check_interval=redis_health_check_interval,
+)
+redis_pool = ConnectionPool(**_redis_pool_kwargs)
+async_redis_pool = aioredis.ConnectionPool(**_redis_pool_kwargs)
+
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
@@ -28,6 +66,28 @@ def get_session() -> Generator[Session, None, None]:
         yield session
 
 
+def get_read_session() -> Generator[Session, None, None]:
+    # For endpoints that only read. Falls back to the primary when no replica is healthy.
+    with Session(replica_router.pick()) as session:
+        yield session
+
+
 def get_redis() -> Generator[Redis, None, None]:
-    with Redis(host=REDIS_HOST, port=REDIS_PORT) as r:
+    # Closing a client built on a shared pool only releases its connection back to the pool.
+    with Redis(connection_pool=redis_pool) as r:
         yield r
+
+
+async def get_async_redis() -> AsyncGenerator[aioredis.Redis, None]:
+    async with aioredis.Redis(connection_pool=async_redis_pool) as r:
+        yield r
+
+
+def _redis_pool_stats(pool) -> dict:
+    in_use, available = len(pool._in_use_connections), len(pool._available_connections)
+    return {"max_connections": pool.max_connections, "created": in_use + available,
+            "in_use": in_use, "available": available}
+
+
+def redis_pool_stats() -> dict:
+    return {"sync": _redis_pool_stats(redis_pool), "async": _redis_pool_stats(async_redis_pool)}
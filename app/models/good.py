@@ -2,7 +2,7 @@ import datetime
 from typing import List
 
 import sqlalchemy
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
@@ -17,6 +17,8 @@ class Good(Base):
     name: Mapped[str] = mapped_column(sqlalchemy.types.String(256), nullable=False)
     description: Mapped[str] = mapped_column(sqlalchemy.types.String(512), nullable=False)
     price: Mapped[int] = mapped_column(sqlalchemy.types.Integer, nullable=False)
+    # Units on hand, NULL when not tracked. Checkout reserves against Redis, see app.services.stock.
+    stock: Mapped[int] = mapped_column(sqlalchemy.types.Integer, nullable=True)
     image_id: Mapped[str] = mapped_column(sqlalchemy.types.String(256), nullable=True)
     details: Mapped[List["GoodDetail"]] = relationship(back_populates="good")
     styles: Mapped[List["GoodStyle"]] = relationship(back_populates="good")
@@ -29,6 +31,16 @@ class Good(Base):
     updated_at: Mapped[datetime.datetime] = mapped_column(sqlalchemy.types.DateTime, nullable=False,
                                                           insert_default=datetime.datetime.now,
                                                           onupdate=datetime.datetime.now)
+    __table_args__ = (
+        # ngram tokenizes CJK text, which the default FULLTEXT parser can't split into words.
+        Index("ix_good_name_description_ft", "name", "description",
+              mysql_prefix="FULLTEXT", mysql_with_parser="ngram"),
+        Index("ix_good_store_id_created_at", "store_id", "created_at"),
+        # Search facets and sorts.
+        Index("ix_good_store_id_price", "store_id", "price"),
+        Index("ix_good_price_id", "price", "id"),
+        Index("ix_good_created_at_id", "created_at", "id"),
+    )
 
 
 class GoodDetail(Base):
@@ -54,6 +66,8 @@ class GoodStyle(Base):
     description: Mapped[str] = mapped_column(sqlalchemy.types.String(512), nullable=True)
     image_id: Mapped[str] = mapped_column(sqlalchemy.types.String(256), nullable=True)
     price: Mapped[int] = mapped_column(sqlalchemy.types.Integer, nullable=False)
+    # Units on hand, NULL when not tracked. Checkout reserves against Redis, see app.services.stock.
+    stock: Mapped[int] = mapped_column(sqlalchemy.types.Integer, nullable=True)
     order_items: Mapped[List["OrderItem"]] = relationship(back_populates="style")
     cart_items: Mapped[List["CartItem"]] = relationship(back_populates="style")
     created_at: Mapped[datetime.datetime] = mapped_column(sqlalchemy.types.DateTime, nullable=False,
@@ -75,6 +89,10 @@ class TagGoodLink(Base):
     updated_at: Mapped[datetime.datetime] = mapped_column(sqlalchemy.types.DateTime, nullable=False,
                                                           insert_default=datetime.datetime.now,
                                                           onupdate=datetime.datetime.now)
+    __table_args__ = (
+        # The primary key leads with id; browsing by tag needs tag_id first.
+        Index("ix_tag_good_link_tag_id_good_id", "tag_id", "good_id"),
+    )
 
 
 class Tag(Base):
@@ -2,7 +2,7 @@ import datetime
 from typing import List, Optional
 
 import sqlalchemy
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
@@ -34,7 +34,10 @@ class Order(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
     user: Mapped[User] = relationship(back_populates="orders")
     total_price: Mapped[int] = mapped_column(sqlalchemy.types.Integer, nullable=True)
+    # 0 unpaid, 1 paid, 2 shipped, 3 received, 4 expired unpaid (its stock reservation was released)
     status: Mapped[int] = mapped_column(sqlalchemy.types.SmallInteger, nullable=False, default=0)
+    # Payment deadline of orders holding a stock reservation.
+    expires_at: Mapped[datetime.datetime] = mapped_column(sqlalchemy.types.DateTime, nullable=True)
     address_id: Mapped[int] = mapped_column(ForeignKey("address.id"))
     address: Mapped[Address] = relationship(back_populates="orders")
     order_items: Mapped[List["OrderItem"]] = relationship(back_populates="order")
@@ -45,6 +48,9 @@ class Order(Base):
     updated_at: Mapped[datetime.datetime] = mapped_column(sqlalchemy.types.DateTime, nullable=False,
                                                           insert_default=datetime.datetime.now,
                                                           onupdate=datetime.datetime.now)
+    __table_args__ = (
+        Index("ix_order_user_id_created_at", "user_id", "created_at"),
+    )
 
 
 class OrderItem(Base):
@@ -63,3 +69,6 @@ class OrderItem(Base):
     updated_at: Mapped[datetime.datetime] = mapped_column(sqlalchemy.types.DateTime, nullable=False,
                                                           insert_default=datetime.datetime.now,
                                                           onupdate=datetime.datetime.now)
+    __table_args__ = (
+        Index("ix_order_item_good_id_created_at", "good_id", "created_at"),
+    )
@@ -1,34 +1,74 @@
+import datetime
 import random
-from typing import Dict
+from typing import Callable, Dict, Set, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
-from sqlalchemy.orm import Session
-from sqlalchemy import select, update, delete, func, or_
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi_pagination import Page, Params
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import select, insert, update, delete, func, or_, and_, cast, case, literal, union_all, Integer
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.mysql import match
+from redis import Redis
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
 
-from app.db import get_session
-from app.auth import current_user, current_superuser
+from app.db import get_session, get_read_session, get_redis, get_async_redis
+from app.auth import current_user, current_user_sync, current_superuser_sync
 from app.models.user import User, Role
 from app.models.store import Store
 from app.models.good import Good, GoodDetail, GoodStyle, TagGoodLink, Tag
+from app.models.order import CartItem, OrderItem
 from app.schemas.good import *
+from app.services import suggest, good_cache, recommend, leaderboard, stock
+from app.services.good_import import GoodImporter, jsonl_records, csv_records
+from app.services.leaderboard import Metric, Window
+from app.services.random_pool import random_goods, random_tags
+from app.utils.pagination_utils import CursorPage, paginate_or_seek, CURSOR_DESCRIPTION
+from app.utils.http_utils import make_etag, cache_headers, is_fresh, not_modified, page_validators
+from app.utils.log_utils import logger
+from config import RECOMMEND_TOP_K
 
 
 good_router = APIRouter(prefix="/good", tags=["商品"])
 tag_router = APIRouter(prefix="/tag", tags=["商品", "标签"])
 
+# MySQL's default ngram_token_size.
+NGRAM_TOKEN_SIZE = 2
 
-@good_router.get("/random", dependencies=[Depends(current_user)], summary="主页获取随机商品")
-def get_random_good(db: Session = Depends(get_session)) -> List[GoodRead]:
+# Lower bounds of the price facet buckets; the last bucket is open-ended.
+PRICE_FACET_BOUNDS = [0, 100, 500, 1000, 5000, 10000, 50000]
+FACET_LIMIT = 50
+BATCH_MAX_IDS = 100
+
+# Everything GoodFullRead reads, in four queries: good+store, details, styles, tag links+tags.
+full_good_options = (
+    joinedload(Good.store),
+    selectinload(Good.details),
+    selectinload(Good.styles),
+    selectinload(Good.tag_links).joinedload(TagGoodLink.tag),
+)
+
+
+@good_router.get("/random", dependencies=[Depends(current_user_sync)], summary="主页获取随机商品")
+def get_random_good(db: Session = Depends(get_read_session), rdb: Redis = Depends(get_redis)) -> List[GoodRead]:
+    good_ids = random_goods.sample(rdb, 100)
+    if good_ids:
+        goods = db.execute(select(Good).where(Good.id.in_(good_ids))).scalars().all()
+        return random.sample(goods, len(goods))
+    # The pool is empty or unavailable.
     total_good = db.execute(select(func.count(Good.id))).scalar_one()
     subquery = select(Good).offset(random.randint(0, max(total_good - 100, 0))).limit(100).subquery()
     query = select(subquery, func.random().label("_rand_num")).order_by("_rand_num")
     return db.execute(query).all()
 
 
-@tag_router.get("/random", dependencies=[Depends(current_user)], summary="主页获取随机tag")
-def get_random_tag(db: Session = Depends(get_session)) -> List[TagRead]:
+@tag_router.get("/random", dependencies=[Depends(current_user_sync)], summary="主页获取随机tag")
+def get_random_tag(db: Session = Depends(get_read_session), rdb: Redis = Depends(get_redis)) -> List[TagRead]:
+    tag_ids = random_tags.sample(rdb, 50)
+    if tag_ids:
+        tags = db.execute(select(Tag).where(Tag.id.in_(tag_ids))).scalars().all()
+        return random.sample(tags, len(tags))
+    # The pool is empty or unavailable.
     total_tag = db.execute(select(func.count(Tag.id))).scalar_one()
     subquery = select(Tag).offset(random.randint(0, max(total_tag - 50, 0))).limit(50).subquery()
     query = select(subquery, func.random().label("_rand_num")).order_by("_rand_num")
@@ -36,8 +76,8 @@ def get_random_tag(db: Session = Depends(get_session)) -> List[TagRead]:
 
 
 @good_router.post("")
-def create_good(good_dict: GoodCreate, user: User = Depends(current_user), db: Session = Depends(get_session))\
-        -> GoodRead:
+def create_good(good_dict: GoodCreate, user: User = Depends(current_user_sync), db: Session = Depends(get_session),
+                rdb: Redis = Depends(get_redis)) -> GoodRead:
     store = db.get(Store, good_dict.store_id)
     if not store or (user.role != Role.Admin and store.owner_id != user.id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Store not found.")
@@ -45,27 +85,108 @@ def create_good(good_dict: GoodCreate, user: User = Depends(current_user), db: S
     db.add(good)
     db.commit()
     db.refresh(good)
+    random_goods.add(rdb, good.id)
+    suggest.add(rdb, "good", good.id, good.name)
     return GoodRead.model_validate(good)
 
 
-@good_router.get("")
-def get_all_good(user: User = Depends(current_user), db: Session = Depends(get_session)) -> Page[GoodRead]:
+@good_router.get("", description=CURSOR_DESCRIPTION)
+def get_all_good(request: Request, response: Response, cursor: Optional[str] = None, params: Params = Depends(),
+                 user: User = Depends(current_user_sync),
+                 db: Session = Depends(get_read_session)) -> Page[GoodRead] | CursorPage[GoodRead]:
     query = select(Good).join(Store, Store.id == Good.store_id)
     if user.role != Role.Admin:
         query = query.where(Store.owner_id == user.id)
-    return paginate(db, query)
+    page = paginate_or_seek(db, query, [Good.id], cursor, params, descending=False)
+    return not_modified(request, response, *page_validators(page, user.id)) or page
+
+
+class GoodFilters:
+    """Filters shared by `/good/search` and `/good/search/facets`, kept per facet so that each facet's
+    counts can leave out its own filter."""
+
+    def __init__(self, q: Optional[str] = None, price_min: Optional[int] = Query(None, ge=0),
+                 price_max: Optional[int] = Query(None, ge=0), store_id: Optional[int] = None,
+                 tag_ids: List[int] = Query([], description="命中任一标签即可")):
+        self.relevance = None
+        self.conditions = {}
+        if q and len(q) >= NGRAM_TOKEN_SIZE:
+            # Phrase search over the ngram FULLTEXT index.
+            phrase = '"' + q.replace('"', " ") + '"'
+            self.relevance = match(Good.name, Good.description, against=phrase).in_boolean_mode()
+            self.conditions["q"] = self.relevance
+        elif q:
+            # Shorter than an ngram token, the FULLTEXT index can't serve it.
+            self.conditions["q"] = or_(Good.name.like(f"%{q}%"), Good.description.like(f"%{q}%"))
+        price = []
+        if price_min is not None:
+            price.append(Good.price >= price_min)
+        if price_max is not None:
+            price.append(Good.price <= price_max)
+        if price:
+            self.conditions["price"] = and_(*price)
+        if store_id is not None:
+            self.conditions["store"] = Good.store_id == store_id
+        if tag_ids:
+            self.conditions["tag"] = Good.id.in_(select(TagGoodLink.good_id).where(TagGoodLink.tag_id.in_(tag_ids)))
+
+    def where(self, *exclude: str) -> list:
+        return [condition for facet, condition in self.conditions.items() if facet not in exclude]
+
+
+@good_router.get("/search", dependencies=[Depends(current_user_sync)], summary="搜索商品",
+                 description="未指定 `sort` 时有 `q` 按相关度排序，否则按 id。" + CURSOR_DESCRIPTION)
+def search_good(filters: GoodFilters = Depends(), sort: Optional[Literal["price", "created_at"]] = None,
+                order: Literal["asc", "desc"] = "desc", cursor: Optional[str] = None, params: Params = Depends(),
+                db: Session = Depends(get_read_session)) -> Page[GoodRead] | CursorPage[GoodRead]:
+    query = select(Good).where(*filters.where())
+    if sort is not None:
+        keys = [getattr(Good, sort), Good.id]
+    elif filters.relevance is not None:
+        # The rank is scaled to an integer so that it compares exactly in the keyset condition.
+        keys = [cast(filters.relevance * 1000000, Integer), Good.id]
+    else:
+        keys = [Good.id]
+    descending = order == "desc"
+    query = query.order_by(*[k.desc() if descending else k.asc() for k in keys])
+    return paginate_or_seek(db, query, keys, cursor, params, descending)
+
+
+def _top_facet_counts(counts: List[tuple]) -> List[FacetCount]:
+    counts = sorted(counts, key=lambda vc: vc[1], reverse=True)[:FACET_LIMIT]
+    return [FacetCount(value=value, count=count) for value, count in counts]
+
 
+@good_router.get("/search/facets", dependencies=[Depends(current_user_sync)], summary="搜索结果分面计数",
+                 description="每个分面的计数不受该分面自身的筛选条件限制。")
+def get_good_facets(filters: GoodFilters = Depends(), db: Session = Depends(get_read_session)) -> GoodFacets:
+    bucket = case(*[(Good.price < bound, i) for i, bound in enumerate(PRICE_FACET_BOUNDS[1:])],
+                  else_=len(PRICE_FACET_BOUNDS) - 1)
+    by_store = (select(literal("store").label("facet"), Good.store_id.label("value"), func.count().label("count"))
+                .where(*filters.where("store")).group_by(Good.store_id))
+    by_tag = (select(literal("tag"), TagGoodLink.tag_id, func.count())
+              .join(Good, Good.id == TagGoodLink.good_id)
+              .where(*filters.where("tag")).group_by(TagGoodLink.tag_id))
+    by_price = (select(literal("price"), bucket.label("value"), func.count())
+                .select_from(Good).where(*filters.where("price")).group_by("value"))
+    facets = {"store": [], "tag": [], "price": []}
+    for facet, value, count in db.execute(union_all(by_store, by_tag, by_price)):
+        facets[facet].append((value, count))
+    bounds = PRICE_FACET_BOUNDS + [None]
+    return GoodFacets(stores=_top_facet_counts(facets["store"]), tags=_top_facet_counts(facets["tag"]),
+                      prices=[PriceFacetCount(min=bounds[v], max=bounds[v + 1], count=c)
+                              for v, c in sorted(facets["price"])])
 
-@good_router.get("/search", dependencies=[Depends(current_user)])
-def get_all_good(q: Optional[str] = None, db: Session = Depends(get_session)) -> Page[GoodRead]:
-    query = select(Good)
-    if q:
-        query = query.where(or_(Good.name.like(f"%{q}%"), Good.description.like(f"%{q}%")))
-    return paginate(db, query)
+
+@good_router.get("/suggest", dependencies=[Depends(current_user)], summary="搜索框自动补全")
+async def suggest_good(q: str = Query(min_length=1, max_length=64), k: int = Query(10, ge=1, le=50),
+                       rdb: aioredis.Redis = Depends(get_async_redis)) -> List[SuggestionRead]:
+    return await suggest.suggest(rdb, q, k)
 
 
 @good_router.delete("/{good_id}")
-def delete_good(good_id: int, user: User = Depends(current_user), db: Session = Depends(get_session)) -> Dict:
+def delete_good(good_id: int, user: User = Depends(current_user_sync), db: Session = Depends(get_session),
+                rdb: Redis = Depends(get_redis)) -> Dict:
     good = db.get(Good, good_id)
     if user.role != Role.Admin and good.store.owner_id != user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Good not found.")
@@ -76,12 +197,15 @@ def delete_good(good_id: int, user: User = Depends(current_user), db: Session =
     query = delete(Good).where(Good.id == good_id)
     db.execute(query)
     db.commit()
+    good_cache.invalidate(rdb, good_id)
+    random_goods.remove(rdb, good_id)
+    suggest.remove(rdb, "good", good_id)
     return {"message": "success"}
 
 
 @good_router.put("/{good_id}")
-def update_good(good_id: int, good_dict: GoodUpdate, user: User = Depends(current_user),
-                db: Session = Depends(get_session)) -> GoodRead:
+def update_good(good_id: int, good_dict: GoodUpdate, user: User = Depends(current_user_sync),
+                db: Session = Depends(get_session), rdb: Redis = Depends(get_redis)) -> GoodRead:
     good = db.get(Good, good_id)
     if not good or (user.role != Role.Admin and good.store.owner_id != user.id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Good not found.")
@@ -89,21 +213,111 @@ def update_good(good_id: int, good_dict: GoodUpdate, user: User = Depends(curren
     db.execute(query)
     db.refresh(good)
     db.commit()
+    good_cache.invalidate(rdb, good_id)
+    if good_dict.name is not None:
+        suggest.add(rdb, "good", good.id, good.name)
     return GoodRead.model_validate(good)
 
 
-@good_router.get("/{good_id}", dependencies=[Depends(current_user)])
-def get_full_good(good_id: int, db: Session = Depends(get_session)) -> GoodFullRead:
-    query = select(Good).where(Good.id == good_id)
-    good = db.execute(query).scalar_one_or_none()
-    if not good:
+@good_router.put("/{good_id}/stock", summary="设置库存")
+def update_good_stock(good_id: int, stock_dict: GoodStockUpdate, user: User = Depends(current_user_sync),
+                      db: Session = Depends(get_session), rdb: Redis = Depends(get_redis)) -> GoodStockRead:
+    good = db.get(Good, good_id)
+    if not good or (user.role != Role.Admin and good.store.owner_id != user.id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Good not found.")
-    return GoodFullRead.model_validate(good)
+    if stock_dict.style_id is not None:
+        style = db.get(GoodStyle, stock_dict.style_id)
+        if not style or style.good_id != good_id:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Style not found.")
+        query = update(GoodStyle).where(GoodStyle.id == style.id)
+    else:
+        query = update(Good).where(Good.id == good_id)
+    db.execute(query.values(stock=stock_dict.stock))
+    db.commit()
+    try:
+        available = stock.set_stock(rdb, stock.sku(good_id, stock_dict.style_id), stock_dict.stock)
+    except RedisError as e:
+        # MySQL has the new stock, but Redis keeps reserving against the old one until this is retried.
+        logger.error(f"update_good_stock: failed to apply stock of good {good_id}", exc_info=e)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Stock not applied, retry.")
+    return GoodStockRead(good_id=good_id, style_id=stock_dict.style_id, stock=stock_dict.stock, available=available)
+
+
+def _cache_full_good(rdb: Redis, good: Good, gen: Optional[bytes]) -> Tuple[bytes, datetime.datetime]:
+    # `good` must come from the primary (see good_cache), with full_good_options.
+    body = GoodFullRead.model_validate(good).model_dump_json().encode()
+    updated_at = max([good.updated_at, good.store.updated_at]
+                     + [m.updated_at for m in [*good.details, *good.styles, *good.tag_links]])
+    good_cache.set_body(rdb, good.id, body, updated_at, gen)
+    return body, updated_at
+
+
+@good_router.get("/top", dependencies=[Depends(current_user_sync)], summary="商品销量榜",
+                 description="`ordered` 按下单件数，`paid` 按支付件数；`day`、`week` 为自然日、自然周。")
+def get_top_good(metric: Metric = "paid", window: Window = "week", n: int = Query(10, ge=1, le=100),
+                 db: Session = Depends(get_read_session), rdb: Redis = Depends(get_redis)) -> List[GoodSalesRead]:
+    return leaderboard.top_goods(rdb, db, metric, "all", window, n)
+
+
+@good_router.get("/batch", dependencies=[Depends(current_user_sync)], summary="按 id 批量获取商品",
+                 description=f"`ids` 可重复传参或以逗号分隔，最多 {BATCH_MAX_IDS} 个；按请求顺序返回，不存在的 id 被忽略。",
+                 response_model=List[GoodFullRead] | List[GoodRead])
+def get_good_batch(ids: List[str] = Query(), full: bool = False, db: Session = Depends(get_read_session),
+                   primary: Session = Depends(get_session), rdb: Redis = Depends(get_redis)) -> Response:
+    try:
+        good_ids = list(dict.fromkeys(int(i) for value in ids for i in value.split(",") if i))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid ids.")
+    if len(good_ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {BATCH_MAX_IDS} ids.")
+    if not full:
+        goods = {good.id: good for good in db.execute(select(Good).where(Good.id.in_(good_ids))).scalars()}
+        bodies = {i: GoodRead.model_validate(good).model_dump_json().encode() for i, good in goods.items()}
+    else:
+        cached = good_cache.get_bodies(rdb, good_ids)
+        bodies = {i: body for i, (body, _, _) in cached.items() if body is not None}
+        missing = [i for i in good_ids if i not in bodies]
+        if missing:
+            query = select(Good).where(Good.id.in_(missing)).options(*full_good_options)
+            for good in primary.execute(query).unique().scalars():
+                bodies[good.id], _ = _cache_full_good(rdb, good, cached[good.id][2])
+    return Response(b"[" + b",".join(bodies[i] for i in good_ids if i in bodies) + b"]",
+                    media_type="application/json")
+
+
+@good_router.get("/{good_id}/related", dependencies=[Depends(current_user_sync)], summary="买了该商品的用户还买了")
+def get_related_good(good_id: int, k: int = Query(10, ge=1, le=RECOMMEND_TOP_K),
+                     db: Session = Depends(get_read_session)) -> List[GoodRead]:
+    good_ids = recommend.related(good_id, k)
+    if not good_ids:
+        return []
+    goods = {good.id: good for good in db.execute(select(Good).where(Good.id.in_(good_ids))).scalars()}
+    # Goods deleted since the last refresh are skipped.
+    return [goods[i] for i in good_ids if i in goods]
+
+
+@good_router.get("/{good_id}", dependencies=[Depends(current_user_sync)], response_model=GoodFullRead)
+def get_full_good(good_id: int, request: Request, db: Session = Depends(get_session),
+                  rdb: Redis = Depends(get_redis)) -> Response:
+    # The primary: only misses reach it, and they fill the cache (see good_cache).
+    body, updated_at, gen = good_cache.get_body(rdb, good_id)
+    if body is None:
+        query = select(Good).where(Good.id == good_id).options(*full_good_options)
+        good = db.execute(query).unique().scalar_one_or_none()
+        if not good:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Good not found.")
+        body, updated_at = _cache_full_good(rdb, good, gen)
+    # updated_at has whole seconds only; the cache generation tells apart edits within the same second.
+    etag = make_etag("good", good_id, updated_at, gen or b"0")
+    headers = cache_headers(etag, updated_at)
+    if is_fresh(request, etag, updated_at):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @good_router.post("/full")
-def create_full_good(good_dict: GoodFullCreate, user: User = Depends(current_user), db: Session = Depends(get_session))\
-        -> GoodFullRead:
+def create_full_good(good_dict: GoodFullCreate, user: User = Depends(current_user_sync),
+                     db: Session = Depends(get_session), rdb: Redis = Depends(get_redis)) -> GoodFullRead:
     store = db.get(Store, good_dict.store_id)
     if not store or (user.role != Role.Admin and store.owner_id != user.id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Store not found.")
@@ -129,67 +343,176 @@ def create_full_good(good_dict: GoodFullCreate, user: User = Depends(current_use
     db.flush()
     db.commit()
     db.refresh(good)
+    random_goods.add(rdb, good.id)
+    suggest.add(rdb, "good", good.id, good.name)
     return GoodFullRead.model_validate(good)
 
 
-@good_router.put("/full/{good_id}")
-def update_full_good(good_id: int, good_dict: GoodFullUpdate, user: User = Depends(current_user),
-                     db: Session = Depends(get_session)) -> GoodFullRead:
-    good = db.get(Good, good_id)
+@good_router.post("/import", summary="批量导入商品",
+                  description="上传 JSONL 或 CSV 文件，每行一个 `GoodFullCreate`；CSV 中 `details`、`styles`、`tag_ids` "
+                              "列为 JSON。未指定 `format` 时按文件扩展名判断。")
+def import_goods(file: UploadFile, format: Optional[Literal["jsonl", "csv"]] = None,
+                 user: User = Depends(current_user_sync), db: Session = Depends(get_session),
+                 rdb: Redis = Depends(get_redis)) -> GoodImportResult:
+    if format is None:
+        format = "csv" if file.filename and file.filename.lower().endswith(".csv") else "jsonl"
+    records = csv_records(file.file) if format == "csv" else jsonl_records(file.file)
+    result = GoodImporter(db, rdb, user).run(records)
+    logger.info(f"import_goods: {user.id=} {result.imported=} {result.failed=}")
+    return result
+
+
+def _diff_children(rows: List, items: List, fields: Set[str], natural_key: Callable, by_position: bool):
+    """Pairs `items` with existing `rows`: by id, then by `natural_key`, then (if `by_position`) by order.
+
+    Returns `(inserts, updates, delete_ids)` ready for bulk statements; unchanged pairs produce nothing.
+    """
+    unmatched = {row.id: row for row in rows}
+    pairs = []
+    for item in items:
+        if item.id is not None and item.id not in unmatched:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Item {item.id} not found.")
+        pairs.append([item, unmatched.pop(item.id) if item.id is not None else None])
+    by_key = {}
+    for row in unmatched.values():
+        by_key.setdefault(natural_key(row), []).append(row)
+    for pair in pairs:
+        if pair[1] is None and by_key.get(natural_key(pair[0])):
+            pair[1] = by_key[natural_key(pair[0])].pop(0)
+            del unmatched[pair[1].id]
+    if by_position:
+        leftovers = iter(list(unmatched.values()))
+        for pair in pairs:
+            if pair[1] is None:
+                pair[1] = next(leftovers, None)
+                if pair[1] is not None:
+                    del unmatched[pair[1].id]
+    inserts, updates = [], []
+    for item, row in pairs:
+        values = item.model_dump(include=fields)
+        if row is None:
+            inserts.append(values)
+        elif any(getattr(row, k) != v for k, v in values.items()):
+            updates.append({"id": row.id, **values})
+    return inserts, updates, list(unmatched)
+
+
+def _apply_diff(db: Session, model, good_id: int, inserts: List[Dict], updates: List[Dict], delete_ids: List[int]):
+    if delete_ids:
+        db.execute(delete(model).where(model.id.in_(delete_ids)))
+    if updates:
+        db.execute(update(model), updates)
+    if inserts:
+        db.execute(insert(model), [{**values, "good_id": good_id} for values in inserts])
+
+
+@good_router.put("/full/{good_id}", description="`details`、`styles` 与现有记录逐项比对，只写入变化的部分；"
+                                                "带 `id` 的项按 id 更新，其余按内容（款式按名称）匹配。")
+def update_full_good(good_id: int, good_dict: GoodFullUpdate, user: User = Depends(current_user_sync),
+                     db: Session = Depends(get_session), rdb: Redis = Depends(get_redis)) -> GoodFullRead:
+    good = db.get(Good, good_id, options=[selectinload(Good.details), selectinload(Good.styles),
+                                          selectinload(Good.tag_links)])
     if not good or (user.role != Role.Admin and good.store.owner_id != user.id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Good not found.")
-    query = update(Good).where(Good.id == good_id).values(
-        **good_dict.model_dump(exclude_none=True, exclude={"details", "styles", "tag_ids"}))
-    db.execute(query)
-    db.refresh(good)
+    style_diff = None
+    if good_dict.styles is not None:
+        # No positional matching: cart and order items point at style ids, so a new style must not take over
+        # the id of a removed one.
+        style_diff = _diff_children(good.styles, good_dict.styles, {"name", "description", "price", "image_id"},
+                                    lambda s: s.name, by_position=False)
+        delete_ids = style_diff[2]
+        if delete_ids and db.execute(select(CartItem.style_id).where(CartItem.style_id.in_(delete_ids))
+                                     .union(select(OrderItem.style_id).where(OrderItem.style_id.in_(delete_ids)))
+                                     .limit(1)).first():
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Style is in use by cart or order items.")
     if good_dict.tag_ids is not None:
         tag_ids_set = set(good_dict.tag_ids)
         tags = db.execute(select(func.count(Tag.id)).where(Tag.id.in_(tag_ids_set))).scalar_one()
         if tags != len(tag_ids_set):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Tag not found.")
-        query = delete(TagGoodLink).where(TagGoodLink.good_id == good_id)
-        db.execute(query)
-        for tag_id in tag_ids_set:
-            tag = TagGoodLink(tag_id=tag_id, good_id=good.id)
-            db.add(tag)
-    if good_dict.details is not None:
-        query = delete(GoodDetail).where(GoodDetail.good_id == good_id)
+    try:
+        if good_dict.tag_ids is not None:
+            current = {link.tag_id: link.id for link in good.tag_links}
+            _apply_diff(db, TagGoodLink, good_id, [{"tag_id": tag_id} for tag_id in tag_ids_set - current.keys()],
+                        [], [link_id for tag_id, link_id in current.items() if tag_id not in tag_ids_set])
+        if good_dict.details is not None:
+            _apply_diff(db, GoodDetail, good_id, *_diff_children(
+                good.details, good_dict.details, {"text", "image_id"}, lambda d: (d.text, d.image_id),
+                by_position=True))
+        if style_diff is not None:
+            _apply_diff(db, GoodStyle, good_id, *style_diff)
+        # Always bumps updated_at, so that child-only changes also move the good's version.
+        query = update(Good).where(Good.id == good_id).values(
+            **good_dict.model_dump(exclude_none=True, exclude={"details", "styles", "tag_ids"}),
+            updated_at=datetime.datetime.now())
         db.execute(query)
-        for detail in good_dict.details:
-            detail_model = GoodDetail(**detail.model_dump(exclude_none=True), good_id=good_id)
-            db.add(detail_model)
-    if good_dict.styles is not None:
-        query = delete(GoodStyle).where(GoodStyle.good_id == good_id)
-        db.execute(query)
-        for style in good_dict.styles:
-            style_model = GoodStyle(**style.model_dump(exclude_none=True), good_id=good_id)
-            db.add(style_model)
-    db.flush()
-    db.commit()
-    db.refresh(good)
+        db.commit()
+    except IntegrityError as e:
+        # A cart or order item added since the check above.
+        db.rollback()
+        logger.warn(f"update_full_good: removed style probably still referenced", exc_info=e)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Style is in use by cart or order items.")
+    good_cache.invalidate(rdb, good_id)
+    if good_dict.name is not None:
+        suggest.add(rdb, "good", good_id, good_dict.name)
+    query = select(Good).where(Good.id == good_id).options(*full_good_options)
+    good = db.execute(query.execution_options(populate_existing=True)).unique().scalar_one()
     return GoodFullRead.model_validate(good)
 
 
-@tag_router.post("", dependencies=[Depends(current_superuser)])
-def create_tag(tag_dict: TagCreate, db: Session = Depends(get_session)) -> TagRead:
+@tag_router.post("", dependencies=[Depends(current_superuser_sync)])
+def create_tag(tag_dict: TagCreate, db: Session = Depends(get_session), rdb: Redis = Depends(get_redis)) -> TagRead:
     tag = Tag(**tag_dict.model_dump(exclude_none=True))
     db.add(tag)
     db.commit()
     db.refresh(tag)
+    random_tags.add(rdb, tag.id)
+    suggest.add(rdb, "tag", tag.id, tag.name)
     return TagRead.model_validate(tag)
 
 
-@tag_router.get("", dependencies=[Depends(current_superuser)])
-def get_all_tag(db: Session = Depends(get_session)) -> Page[TagRead]:
+@tag_router.get("", dependencies=[Depends(current_superuser_sync)], description=CURSOR_DESCRIPTION)
+def get_all_tag(request: Request, response: Response, cursor: Optional[str] = None, params: Params = Depends(),
+                db: Session = Depends(get_read_session)) -> Page[TagRead] | CursorPage[TagRead]:
     query = select(Tag)
-    return paginate(db, query)
+    page = paginate_or_seek(db, query, [Tag.id], cursor, params, descending=False)
+    return not_modified(request, response, *page_validators(page)) or page
+
+
+@tag_router.get("/{tag_id}/goods", dependencies=[Depends(current_user_sync)], summary="按标签浏览商品",
+                description=CURSOR_DESCRIPTION)
+def get_tag_goods(tag_id: int, request: Request, response: Response,
+                  sort: Literal["created_at", "price"] = "created_at", order: Literal["asc", "desc"] = "desc",
+                  cursor: Optional[str] = None, params: Params = Depends(),
+                  db: Session = Depends(get_read_session)) -> Page[GoodRead] | CursorPage[GoodRead]:
+    if not db.get(Tag, tag_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Tag not found.")
+    keys = [getattr(Good, sort), Good.id]
+    query = (select(Good)
+             .join(TagGoodLink, TagGoodLink.good_id == Good.id)
+             .where(TagGoodLink.tag_id == tag_id)
+             .order_by(*[k.desc() if order == "desc" else k.asc() for k in keys]))
+    page = paginate_or_seek(db, query, keys, cursor, params, descending=order == "desc")
+    return not_modified(request, response, *page_validators(page)) or page
+
+
+@tag_router.get("/{tag_id}/top", dependencies=[Depends(current_user_sync)], summary="标签内商品销量榜")
+def get_tag_top_good(tag_id: int, metric: Metric = "paid", window: Window = "week", n: int = Query(10, ge=1, le=100),
+                     db: Session = Depends(get_read_session), rdb: Redis = Depends(get_redis)) -> List[GoodSalesRead]:
+    return leaderboard.top_goods(rdb, db, metric, f"tag:{tag_id}", window, n)
 
 
-@tag_router.delete("/{tag_id}", dependencies=[Depends(current_superuser)])
-def delete_tag(tag_id: int, db: Session = Depends(get_session)) -> Dict:
+@tag_router.delete("/{tag_id}", dependencies=[Depends(current_superuser_sync)])
+def delete_tag(tag_id: int, db: Session = Depends(get_session), rdb: Redis = Depends(get_redis)) -> Dict:
+    good_ids = db.execute(select(TagGoodLink.good_id).where(TagGoodLink.tag_id == tag_id)).scalars().all()
     query = delete(TagGoodLink).where(TagGoodLink.tag_id == tag_id)
     db.execute(query)
     query = delete(Tag).where(Tag.id == tag_id)
     db.execute(query)
     db.commit()
+    if good_ids:
+        good_cache.invalidate(rdb, *good_ids)
+    random_tags.remove(rdb, tag_id)
+    suggest.remove(rdb, "tag", tag_id)
     return {"message": "success"}
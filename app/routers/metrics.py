@@ -0,0 +1,23 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends
+
+from app.auth import current_superuser, token_cache_stats
+from app.db import redis_pool_stats, replica_router
+from app.services import hashing, user_cache
+from app.utils.pool_utils import pool_stats
+
+
+metrics_router = APIRouter(prefix="/metrics", tags=["监控"], dependencies=[Depends(current_superuser)])
+
+
+@metrics_router.get("", summary="运行指标")
+async def get_metrics() -> Dict[str, Any]:
+    return {
+        "password_hash": hashing.stats(),
+        "user_cache": user_cache.stats(),
+        "token_cache": token_cache_stats(),
+        "redis_pool": redis_pool_stats(),
+        "db_pool": pool_stats(),
+        "db_replicas": replica_router.stats(),
+    }
@@ -1,30 +1,48 @@
 from typing import Dict, Set, Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status, Body
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import select, update, delete
-
-from app.db import get_session
-from app.auth import current_user
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status, Body
+from fastapi.responses import JSONResponse
+from fastapi_pagination import Page, Params
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.exc import SQLAlchemyError
+from redis import Redis
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.db import get_session, get_read_session, get_redis, get_async_redis
+from app.auth import current_user, current_user_sync
 from app.models.user import User, Role, Address
 from app.models.good import Good, GoodStyle
 from app.models.order import CartItem, Order, OrderItem
 from app.schemas.order import *
+from app.services import checkout, leaderboard, stock, order_intake
+from app.utils.pagination_utils import CursorPage, paginate_or_seek, CURSOR_DESCRIPTION
+from app.utils.http_utils import make_etag, not_modified, page_validators
+from app.utils.log_utils import logger
+from config import ORDER_INTAKE_ENABLED
 
 
 order_router = APIRouter(prefix="/order", tags=["订单"])
 
+# Everything OrderFullRead reads, in two queries: order+address, items+goods+styles.
+full_order_options = (
+    joinedload(Order.address),
+    selectinload(Order.order_items).joinedload(OrderItem.good),
+    selectinload(Order.order_items).joinedload(OrderItem.style),
+)
+_QUEUED_RESPONSES = {status.HTTP_202_ACCEPTED: {"model": OrderTicketRead, "description": "`order_intake` 开启时排队"}}
+
 
-@order_router.get("/cart")
-def get_all_cart_item(user: User = Depends(current_user), db: Session = Depends(get_session)) -> Page[CartItemRead]:
+@order_router.get("/cart", description=CURSOR_DESCRIPTION)
+def get_all_cart_item(cursor: Optional[str] = None, params: Params = Depends(), user: User = Depends(current_user_sync),
+                      db: Session = Depends(get_read_session)) -> Page[CartItemRead] | CursorPage[CartItemRead]:
     query = select(CartItem).options(joinedload(CartItem.good)).where(CartItem.user_id == user.id)
-    return paginate(db, query)
+    return paginate_or_seek(db, query, [CartItem.id], cursor, params, descending=False)
 
 
 @order_router.put("/cart")
-def create_cart_item(cart_dict: CartItemCreate, user: User = Depends(current_user),
+def create_cart_item(cart_dict: CartItemCreate, user: User = Depends(current_user_sync),
                      db: Session = Depends(get_session)) -> CartItemRead:
     good = db.get(Good, cart_dict.good_id)
     if not good:
@@ -41,7 +59,7 @@ def create_cart_item(cart_dict: CartItemCreate, user: User = Depends(current_use
 
 
 @order_router.delete("/cart/{cart_item_id}")
-def delete_cart_item(cart_item_id: int, user: User = Depends(current_user), db: Session = Depends(get_session)) \
+def delete_cart_item(cart_item_id: int, user: User = Depends(current_user_sync), db: Session = Depends(get_session)) \
         -> Dict:
     cart_item = db.get(CartItem, cart_item_id)
     if not cart_item or (user.role != Role.Admin and cart_item.user_id != user.id):
@@ -51,13 +69,16 @@ def delete_cart_item(cart_item_id: int, user: User = Depends(current_user), db:
     return {"message": "success"}
 
 
-@order_router.get("")
-def get_all_order(user: User = Depends(current_user), db: Session = Depends(get_session)) -> Page[OrderRead]:
+@order_router.get("", description=CURSOR_DESCRIPTION)
+def get_all_order(request: Request, response: Response, cursor: Optional[str] = None, params: Params = Depends(),
+                  user: User = Depends(current_user_sync),
+                  db: Session = Depends(get_read_session)) -> Page[OrderRead] | CursorPage[OrderRead]:
     query = select(Order)
     if user.role != Role.Admin:
         query = query.where(Order.user_id == user.id)
     query = query.order_by(Order.created_at.desc())
-    return paginate(db, query)
+    page = paginate_or_seek(db, query, [Order.created_at, Order.id], cursor, params)
+    return not_modified(request, response, *page_validators(page, user.id)) or page
 
 
 def _create_order_items(order_goods: List[OrderItemFullCreate], order_id: int, goods: Dict[int, Good])\
@@ -74,33 +95,67 @@ def _create_order_items(order_goods: List[OrderItemFullCreate], order_id: int, g
     return order_items
 
 
-@order_router.post("/full")
-def create_order(order_dict: OrderFullCreate, user: User = Depends(current_user), db: Session = Depends(get_session))\
-        -> OrderFullRead:
-    good_id_set = set(map(lambda g: g.good_id, order_dict.goods))
-    query = (select(Good)
-             .options(joinedload(Good.styles))
-             .where(Good.id.in_(good_id_set)))
-    goods = db.execute(query).unique().scalars().all()
-    if len(goods) != len(good_id_set):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Good not found.")
-    good_map = dict(map(lambda g: (g.id, g), goods))
-    order_items = _create_order_items(order_dict.goods, 0, good_map)
-    order = Order(**order_dict.model_dump(exclude={"goods"}), user_id=user.id)
-    order.total_price = sum(map(lambda o: o.price * o.count, order_items))
+def _reserve_stock(rdb: Redis, db: Session, order: Order, basket: stock.Basket):
+    # `order` is flushed but not committed. Should the commit fail later, the caller releases the reservation.
+    if not basket:
+        return
+    try:
+        short_sku, order.expires_at = stock.reserve(rdb, order.id, basket)
+    except RedisError as e:
+        db.rollback()
+        logger.error(f"_reserve_stock: failed to reserve stock for order {order.id}", exc_info=e)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Stock unavailable, retry.")
+    if short_sku is not None:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Out of stock.")
+
+
+def _queue_order(rdb: Redis, user: User, order_dict: OrderFullCreate) -> Optional[JSONResponse]:
+    # Falls back to placing the order synchronously when the stream can't be reached.
+    if not ORDER_INTAKE_ENABLED:
+        return None
+    ticket = order_intake.submit(rdb, user, order_dict)
+    if ticket is None:
+        return None
+    return JSONResponse(ticket.model_dump(), status_code=status.HTTP_202_ACCEPTED)
+
+
+@order_router.post("/full", responses=_QUEUED_RESPONSES)
+def create_order(order_dict: OrderFullCreate, user: User = Depends(current_user_sync), db: Session = Depends(get_session),
+                 rdb: Redis = Depends(get_redis)) -> OrderFullRead:
+    return _queue_order(rdb, user, order_dict) or _place_order(order_dict, user, db, rdb)
+
+
+def _place_order(order_dict: OrderFullCreate, user: User, db: Session, rdb: Redis) -> OrderFullRead:
+    # A fixed number of round trips whatever the basket size: prices, style prices, the order, all of its
+    # items in one multi-row INSERT, and two queries for the response.
+    try:
+        rows, basket = checkout.price_items(order_dict.goods, checkout.load_prices(db, order_dict.goods))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    order = Order(**order_dict.model_dump(exclude={"goods"}), user_id=user.id,
+                  total_price=sum(row["price"] * row["count"] for row in rows))
     db.add(order)
     db.flush()
-    db.refresh(order)
-    for order_item in order_items:
-        order_item.order_id = order.id
-    db.bulk_save_objects(order_items)
-    db.commit()
-    db.refresh(order)
+    order_id = order.id
+    _reserve_stock(rdb, db, order, basket)
+    try:
+        if rows:
+            db.execute(insert(OrderItem.__table__), [{**row, "order_id": order_id} for row in rows])
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+        if basket:
+            stock.release_unplaced(rdb, order_id)
+        raise
+    leaderboard.record(rdb, db, "ordered", [(row["good_id"], row["count"]) for row in rows])
+    order = db.execute(select(Order).options(*full_order_options).where(Order.id == order_id)).scalar_one()
     return OrderFullRead.model_validate(order)
 
 
 @order_router.delete("/{order_id}")
-def delete_order(order_id: int, user: User = Depends(current_user), db: Session = Depends(get_session)) -> Dict:
+def delete_order(order_id: int, user: User = Depends(current_user_sync), db: Session = Depends(get_session),
+                 rdb: Redis = Depends(get_redis)) -> Dict:
     order = db.get(Order, order_id)
     if not order or (user.role != Role.Admin and order.user_id != user.id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Order not found.")
@@ -111,20 +166,32 @@ def delete_order(order_id: int, user: User = Depends(current_user), db: Session
     db.execute(query)
     db.flush()
     db.commit()
+    if order.expires_at is not None and order.status == 0:
+        try:
+            stock.release(rdb, order_id)
+        except RedisError as e:
+            # Released once it expires instead.
+            logger.error(f"delete_order: failed to release stock of order {order_id}", exc_info=e)
     return {"message": "success"}
 
 
 @order_router.get("/{order_id}")
-def get_full_order(order_id: int, user: User = Depends(current_user), db: Session = Depends(get_session)) \
-        -> OrderFullRead:
-    order = db.get(Order, order_id)
+def get_full_order(order_id: int, request: Request, response: Response, user: User = Depends(current_user_sync),
+                   db: Session = Depends(get_read_session)) -> OrderFullRead:
+    order = db.get(Order, order_id, options=full_order_options)
     if not order or (user.role != Role.Admin and order.user_id != user.id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Order not found.")
-    return OrderFullRead.model_validate(order)
+    order_read = OrderFullRead.model_validate(order)
+    # The ETag hashes the response itself: updated_at has whole seconds only, so versions built from it miss a
+    # second edit within the same second. Loading the order is two queries, as many as reading versions was.
+    last_modified = max([order.updated_at, order.address.updated_at]
+                        + [m.updated_at for item in order.order_items for m in (item, item.good, item.style) if m])
+    etag = make_etag("order", order_read.model_dump_json())
+    return not_modified(request, response, etag, last_modified) or order_read
 
 
 @order_router.put("/{order_id}")
-def update_full_order(order_id: int, order_dict: OrderFullUpdate, user: User = Depends(current_user),
+def update_full_order(order_id: int, order_dict: OrderFullUpdate, user: User = Depends(current_user_sync),
                       db: Session = Depends(get_session)) -> OrderFullRead:
     order = db.get(Order, order_id)
     if not order or (user.role != Role.Admin and order.user_id != user.id):
@@ -142,6 +209,13 @@ def update_full_order(order_id: int, order_dict: OrderFullUpdate, user: User = D
     goods = db.execute(query).unique().scalars().all()
     good_map = dict(map(lambda g: (g.id, g), goods))
     order_items = _create_order_items(order_dict.goods, order.id, good_map)
+    # Changing what a reservation holds would need re-reserving; a new order does that.
+    style_stocks = {s.id: s.stock for g in goods for s in g.styles}
+    if order.expires_at is not None or any(
+            (style_stocks[o.style_id] if o.style_id else good_map[o.good_id].stock) is not None for o in order_items):
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Orders with stock-tracked goods can't be changed.")
     order.total_price = sum(map(lambda o: o.price * o.count, order_items))
     db.bulk_save_objects(order_items)
     db.flush()
@@ -150,10 +224,15 @@ def update_full_order(order_id: int, order_dict: OrderFullUpdate, user: User = D
     return OrderFullRead.model_validate(order)
 
 
-@order_router.post("/direct-buy", summary="立即购买")
+@order_router.post("/direct-buy", summary="立即购买", responses=_QUEUED_RESPONSES)
 def direct_buy_good(good_id: Annotated[int, Body()], count: Annotated[int, Body(gt=0)],
                     address_id: Annotated[int, Body()], style_id: Annotated[Optional[int], Body()] = None,
-                    user: User = Depends(current_user), db: Session = Depends(get_session)) -> OrderFullRead:
+                    user: User = Depends(current_user_sync), db: Session = Depends(get_session),
+                    rdb: Redis = Depends(get_redis)) -> OrderFullRead:
+    queued = _queue_order(rdb, user, OrderFullCreate(address_id=address_id, goods=[
+        OrderItemFullCreate(good_id=good_id, style_id=style_id, count=count)]))
+    if queued is not None:
+        return queued
     good = db.get(Good, good_id)
     address = db.get(Address, address_id)
     # Check address.
@@ -173,18 +252,28 @@ def direct_buy_good(good_id: Annotated[int, Body()], count: Annotated[int, Body(
     db.add(order)
     db.flush()
     db.refresh(order)
+    basket = stock.Basket()
+    basket.add(good_id, style_id, count, style.stock if style else good.stock)
+    _reserve_stock(rdb, db, order, basket)
     # Create the only order item.
     order_item = OrderItem(order_id=order.id, good_id=good_id, style_id=style_id,
                            count=count, price=style.price if style else good.price)
     db.add(order_item)
-    db.commit()
+    try:
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+        if basket:
+            stock.release_unplaced(rdb, order_item.order_id)
+        raise
+    leaderboard.record(rdb, db, "ordered", [(good_id, count)])
     db.refresh(order)
     return OrderFullRead.model_validate(order)
 
 
 @order_router.post("/cart-buy", summary="购物车结算")
-def cart_buy_good(cart_item_ids: Set[int], address_id: Annotated[int, Body()], user: User = Depends(current_user),
-                  db: Session = Depends(get_session)) -> OrderFullRead:
+def cart_buy_good(cart_item_ids: Set[int], address_id: Annotated[int, Body()], user: User = Depends(current_user_sync),
+                  db: Session = Depends(get_session), rdb: Redis = Depends(get_redis)) -> OrderFullRead:
     cart_items = db.execute(select(CartItem).where(CartItem.id.in_(cart_item_ids))).scalars().all()
     if len(cart_items) != len(cart_item_ids):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cart item not found.")
@@ -194,4 +283,13 @@ def cart_buy_good(cart_item_ids: Set[int], address_id: Annotated[int, Body()], u
     query = delete(CartItem).where(CartItem.id.in_(cart_item_ids))
     db.execute(query)
     # FIXME: Dirty hack...
-    return create_order(order_create, user, db)
+    return _place_order(order_create, user, db, rdb)
+
+
+@order_router.get("/intake/{ticket}", summary="查询排队下单结果", description="`wait` 秒内等待结果，为 0 时立即返回。")
+async def get_order_ticket(ticket: str, wait: float = Query(0, ge=0, le=30), user: User = Depends(current_user),
+                           rdb: aioredis.Redis = Depends(get_async_redis)) -> OrderTicketRead:
+    found = await order_intake.get_ticket(rdb, ticket, wait)
+    if not found or (user.role != Role.Admin and found[0] != user.id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ticket not found.")
+    return found[1]
@@ -4,19 +4,24 @@ from typing import Dict, List
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy import select, func
+from sqlalchemy.exc import SQLAlchemyError
+from redis import Redis
+from redis.exceptions import RedisError
 
-from app.auth import current_user
-from app.db import get_session
-from app.models.order import Order
+from app.auth import current_user_sync
+from app.db import get_session, get_redis
+from app.models.order import Order, OrderItem
 from app.models.pay import Payment
 from app.models.user import User
 from app.schemas.pay import PaymentRead, PaymentCreate
+from app.services import leaderboard, stock
+from app.utils.log_utils import logger
 
 
 pay_router = APIRouter(prefix="/v1/pay", tags=["支付"])
 
 
-@pay_router.get("/avail", dependencies=[Depends(current_user)], summary="获取可用支付方式")
+@pay_router.get("/avail", dependencies=[Depends(current_user_sync)], summary="获取可用支付方式")
 def get_available_services() -> List[Dict]:
     return [
         {"id": 1, "name": "支付宝"},
@@ -26,13 +31,15 @@ def get_available_services() -> List[Dict]:
 
 
 @pay_router.post("/pay-order", summary="支付订单")
-def pay_order(pay_dict: PaymentCreate, user: User = Depends(current_user),
-              db: Session = Depends(get_session)) -> PaymentRead:
+def pay_order(pay_dict: PaymentCreate, user: User = Depends(current_user_sync),
+              db: Session = Depends(get_session), rdb: Redis = Depends(get_redis)) -> PaymentRead:
     order = db.get(Order, pay_dict.order_id)
     if not order or order.user_id != user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Order not found.")
     if db.execute(select(func.count(Payment.id)).where(Payment.order_id == pay_dict.order_id)).scalar_one() > 0:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Already payed.")
+    if order.status == stock.ORDER_EXPIRED:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Order expired.")
     # No discounts, no pay for others...
     payment = Payment(
         seq=token_hex(16).upper(),
@@ -44,6 +51,31 @@ def pay_order(pay_dict: PaymentCreate, user: User = Depends(current_user),
     )
     db.add(payment)
     order.status = 1
-    db.commit()
+    order_id, expires_at, confirmed = order.id, order.expires_at, {}
+    if expires_at is not None:
+        # Turns the reservation into sales, unless it has just expired.
+        db.flush()
+        try:
+            confirmed = stock.confirm(rdb, order_id)
+        except RedisError as e:
+            db.rollback()
+            logger.error(f"pay_order: failed to confirm stock of order {order_id}", exc_info=e)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Stock unavailable, retry.")
+        if not confirmed:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Order expired.")
+    try:
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+        if confirmed:
+            # Unpaid again: the units go back to the reservation, so that a retry can still pay.
+            try:
+                stock.unconfirm(rdb, order_id, confirmed, expires_at)
+            except RedisError as e:
+                logger.error(f"pay_order: failed to unconfirm stock of order {order_id}", exc_info=e)
+        raise
+    items = db.execute(select(OrderItem.good_id, OrderItem.count).where(OrderItem.order_id == order.id)).all()
+    leaderboard.record(rdb, db, "paid", items)
     db.refresh(payment)
     return PaymentRead.model_validate(payment)
@@ -1,27 +1,30 @@
 import datetime
 import threading
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Optional
 
 import sqlalchemy
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi_pagination import Page, Params
 from sqlalchemy import select, update, delete, func, column
 from sqlalchemy.orm import Session
 from redis import Redis
 
-from app.db import get_session, get_redis
-from app.auth import current_user, current_store
+from app.db import get_session, get_read_session, get_redis
+from app.auth import current_user_sync, current_store_sync
 from app.models.good import Good
 from app.models.order import OrderItem, Order
 from app.models.user import User, Role, Address
 from app.models.store import Store
 from app.models.notification import Notification
 from app.schemas.user import AddressRead
-from app.schemas.good import GoodRead
+from app.schemas.good import GoodRead, GoodSalesRead
 from app.schemas.order import OrderItemFullRead
 from app.schemas.store import StoreRead, StoreCreate, StoreUpdate, StoreProfile, StoreGoodProfile
+from app.services import good_cache, leaderboard
+from app.services.leaderboard import Metric, Window
 from app.services.mail import send_mail
+from app.utils.pagination_utils import CursorPage, paginate_or_seek, CURSOR_DESCRIPTION
+from app.utils.http_utils import not_modified, page_validators
 
 
 store_router = APIRouter(prefix="/store", tags=["店铺"])
@@ -29,7 +32,7 @@ store_good_router = APIRouter(prefix="/sgood", tags=["商品", "店铺"])
 
 
 @store_router.post("")
-def create_store(store_dict: StoreCreate, user: User = Depends(current_user), db: Session = Depends(get_session))\
+def create_store(store_dict: StoreCreate, user: User = Depends(current_user_sync), db: Session = Depends(get_session))\
         -> StoreRead:
     store = Store(**store_dict.model_dump(exclude_none=True), owner_id=user.id)
     db.add(store)
@@ -38,16 +41,26 @@ def create_store(store_dict: StoreCreate, user: User = Depends(current_user), db
     return StoreRead.model_validate(store)
 
 
-@store_router.get("")
-def get_all_store(user: User = Depends(current_user), db: Session = Depends(get_session)) -> Page[StoreRead]:
+@store_router.get("", description=CURSOR_DESCRIPTION)
+def get_all_store(request: Request, response: Response, cursor: Optional[str] = None, params: Params = Depends(),
+                  user: User = Depends(current_user_sync),
+                  db: Session = Depends(get_read_session)) -> Page[StoreRead] | CursorPage[StoreRead]:
     query = select(Store)
     if user.role != Role.Admin:
         query = query.where(Store.owner_id == user.id)
-    return paginate(db, query)
+    page = paginate_or_seek(db, query, [Store.id], cursor, params, descending=False)
+    return not_modified(request, response, *page_validators(page, user.id)) or page
+
+
+@store_router.get("/{store_id}/top", dependencies=[Depends(current_user_sync)], summary="店铺商品销量榜")
+def get_store_top_good(store_id: int, metric: Metric = "paid", window: Window = "week",
+                       n: int = Query(10, ge=1, le=100), db: Session = Depends(get_read_session),
+                       rdb: Redis = Depends(get_redis)) -> List[GoodSalesRead]:
+    return leaderboard.top_goods(rdb, db, metric, f"store:{store_id}", window, n)
 
 
 @store_router.delete("/{store_id}")
-def delete_store(store_id: int, user: User = Depends(current_user), db: Session = Depends(get_session)) -> Dict:
+def delete_store(store_id: int, user: User = Depends(current_user_sync), db: Session = Depends(get_session)) -> Dict:
     query = delete(Store).where(Store.id == store_id)
     if user.role != Role.Admin:
         query = query.where(Store.owner_id == user.id)
@@ -57,7 +70,8 @@ def delete_store(store_id: int, user: User = Depends(current_user), db: Session
 
 
 @store_router.put("/{store_id}")
-def update_store(store_id: int, store_dict: StoreUpdate, user: User = Depends(current_user), db: Session = Depends(get_session)) -> StoreRead:
+def update_store(store_id: int, store_dict: StoreUpdate, user: User = Depends(current_user_sync), db: Session = Depends(get_session),
+                 rdb: Redis = Depends(get_redis)) -> StoreRead:
     store = db.get(Store, store_id)
     if not store or (user.role != Role.Admin and store.owner_id != user.id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Address not found.")
@@ -65,28 +79,38 @@ def update_store(store_id: int, store_dict: StoreUpdate, user: User = Depends(cu
     db.execute(query)
     db.refresh(store)
     db.commit()
+    # Cached goods embed their store.
+    good_ids = db.execute(select(Good.id).where(Good.store_id == store_id)).scalars().all()
+    if good_ids:
+        good_cache.invalidate(rdb, *good_ids)
     return StoreRead.model_validate(store)
 
 
-@store_good_router.get("")
-def get_all_store_good(store: Store = Depends(current_store), db: Session = Depends(get_session)) -> Page[GoodRead]:
+@store_good_router.get("", description=CURSOR_DESCRIPTION)
+def get_all_store_good(request: Request, response: Response, cursor: Optional[str] = None, params: Params = Depends(),
+                       store: Store = Depends(current_store_sync),
+                       db: Session = Depends(get_read_session)) -> Page[GoodRead] | CursorPage[GoodRead]:
     query = select(Good).where(Good.store_id == store.id).order_by(Good.created_at.desc())
-    return paginate(db, query)
+    page = paginate_or_seek(db, query, [Good.created_at, Good.id], cursor, params)
+    return not_modified(request, response, *page_validators(page)) or page
 
 
-@store_good_router.get("/orders/{good_id}")
-def get_store_good_orders(good_id: int, store: Store = Depends(current_store), db: Session = Depends(get_session)) \
-        -> Page[OrderItemFullRead]:
+@store_good_router.get("/orders/{good_id}", description=CURSOR_DESCRIPTION)
+def get_store_good_orders(good_id: int, cursor: Optional[str] = None, params: Params = Depends(),
+                          store: Store = Depends(current_store_sync),
+                          db: Session = Depends(get_read_session)) \
+        -> Page[OrderItemFullRead] | CursorPage[OrderItemFullRead]:
     query = (select(OrderItem)
              .join(Good, Good.id == OrderItem.good_id)
              .where(Good.store_id == store.id)
              .where(Good.id == good_id)
              .order_by(OrderItem.created_at.desc()))
-    return paginate(db, query)
+    return paginate_or_seek(db, query, [OrderItem.created_at, OrderItem.id], cursor, params)
 
 
 @store_good_router.get("/profile")
-def get_store_profile(store: Store = Depends(current_store), db: Session = Depends(get_session)) -> StoreProfile:
+def get_store_profile(store: Store = Depends(current_store_sync),
+                      db: Session = Depends(get_read_session)) -> StoreProfile:
     day_order_count = db.execute(
         select(func.count(OrderItem.id))
         .join(Good, Good.id == OrderItem.good_id)
@@ -126,7 +150,8 @@ def get_store_profile(store: Store = Depends(current_store), db: Session = Depen
 
 
 @store_good_router.get("/profile/good")
-def get_store_good_profile(good_id: int, store: Store = Depends(current_store), db: Session = Depends(get_session))\
+def get_store_good_profile(good_id: int, store: Store = Depends(current_store_sync),
+                           db: Session = Depends(get_read_session))\
         -> StoreGoodProfile:
     query = (select(func.cast(OrderItem.created_at, sqlalchemy.DATE).label("date"), func.count(OrderItem.id))
              .join(Good, Good.id == OrderItem.good_id)
@@ -160,7 +185,7 @@ def get_store_good_profile(good_id: int, store: Store = Depends(current_store),
 
 
 @store_good_router.put("/send")
-def send_store_good(order_item_id: int, store: Store = Depends(current_store),
+def send_store_good(order_item_id: int, store: Store = Depends(current_store_sync),
                     db: Session = Depends(get_session), rdb: Redis = Depends(get_redis)) -> bool:
     order_item = db.get(OrderItem, order_item_id)
     if not order_item or order_item.good.store_id != store.id:
@@ -182,8 +207,8 @@ def send_store_good(order_item_id: int, store: Store = Depends(current_store),
 
 
 @store_good_router.get("/status")
-def get_order_item_status(order_item_id: int, store: Store = Depends(current_store),
-                          db: Session = Depends(get_session), rdb: Redis = Depends(get_redis)) -> bool:
+def get_order_item_status(order_item_id: int, store: Store = Depends(current_store_sync),
+                          db: Session = Depends(get_read_session), rdb: Redis = Depends(get_redis)) -> bool:
     order_item = db.get(OrderItem, order_item_id)
     if not order_item or order_item.good.store_id != store.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Order item not found.")
@@ -194,8 +219,8 @@ def get_order_item_status(order_item_id: int, store: Store = Depends(current_sto
 
 
 @store_good_router.get("/address")
-def get_order_item_address(order_item_id: int, store: Store = Depends(current_store),
-                           db: Session = Depends(get_session)) -> AddressRead:
+def get_order_item_address(order_item_id: int, store: Store = Depends(current_store_sync),
+                           db: Session = Depends(get_read_session)) -> AddressRead:
     order_item = db.get(OrderItem, order_item_id)
     if not order_item or order_item.good.store_id != store.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Order item not found.")
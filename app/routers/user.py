@@ -1,17 +1,17 @@
 import datetime
-from typing import Dict
+from typing import Dict, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
+from fastapi_pagination import Page, Params
 from sqlalchemy.orm import Session
 from sqlalchemy import select, delete, update, func
 
-from app.db import get_session
-from app.auth import current_user
+from app.db import get_session, get_read_session
+from app.auth import current_user_sync
 from app.models import Address, User
 from app.models.order import Order, OrderItem
 from app.schemas.user import AddressRead, AddressCreate, AddressUpdate, Role, UserProfile
+from app.utils.pagination_utils import CursorPage, paginate_or_seek, CURSOR_DESCRIPTION
 
 
 user_router = APIRouter(prefix="/user", tags=["用户"])
@@ -19,7 +19,7 @@ address_router = APIRouter(prefix="/address", tags=["收货地址"])
 
 
 @address_router.post("")
-def create_address(address_dict: AddressCreate, user: User = Depends(current_user), db: Session = Depends(get_session))\
+def create_address(address_dict: AddressCreate, user: User = Depends(current_user_sync), db: Session = Depends(get_session))\
         -> AddressRead:
     address = Address(**address_dict.model_dump(), user_id=user.id)
     db.add(address)
@@ -28,16 +28,17 @@ def create_address(address_dict: AddressCreate, user: User = Depends(current_use
     return AddressRead.model_validate(address)
 
 
-@address_router.get("")
-def get_all_address(user: User = Depends(current_user), db: Session = Depends(get_session)) -> Page[AddressRead]:
+@address_router.get("", description=CURSOR_DESCRIPTION)
+def get_all_address(cursor: Optional[str] = None, params: Params = Depends(), user: User = Depends(current_user_sync),
+                    db: Session = Depends(get_read_session)) -> Page[AddressRead] | CursorPage[AddressRead]:
     query = select(Address)
     if user.role != Role.Admin:
         query = query.where(Address.user_id == user.id)
-    return paginate(db, query)
+    return paginate_or_seek(db, query, [Address.id], cursor, params, descending=False)
 
 
 @address_router.delete("/{address_id}")
-def delete_address(address_id: int, user: User = Depends(current_user), db: Session = Depends(get_session)) -> Dict:
+def delete_address(address_id: int, user: User = Depends(current_user_sync), db: Session = Depends(get_session)) -> Dict:
     query = delete(Address).where(Address.id == address_id)
     if user.role != Role.Admin:
         query = query.where(Address.user_id == user.id)
@@ -47,7 +48,7 @@ def delete_address(address_id: int, user: User = Depends(current_user), db: Sess
 
 
 @address_router.put("/{address_id}")
-def update_address(address_id: int, address_dict: AddressUpdate, user: User = Depends(current_user),
+def update_address(address_id: int, address_dict: AddressUpdate, user: User = Depends(current_user_sync),
                    db: Session = Depends(get_session)) -> AddressRead:
     address = db.get(Address, address_id)
     if not address or (user.role != Role.Admin and address.user_id != user.id):
@@ -60,7 +61,7 @@ def update_address(address_id: int, address_dict: AddressUpdate, user: User = De
 
 
 @user_router.get("/profile", summary="用户汇总信息")
-def get_user_profile(user: User = Depends(current_user), db: Session = Depends(get_session)) -> UserProfile:
+def get_user_profile(user: User = Depends(current_user_sync), db: Session = Depends(get_read_session)) -> UserProfile:
     reg_days = (datetime.datetime.now() - user.created_at).days
     order_count = db.execute(
         select(func.count(Order.id)).
@@ -1,7 +1,7 @@
 import datetime
-from typing import Optional, List
+from typing import Optional, List, Literal
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, NonNegativeInt
 
 from .store import StoreRead
 
@@ -31,6 +31,12 @@ class GoodUpdate(BaseModel):
     image_id: Optional[str] = None
 
 
+class SuggestionRead(BaseModel):
+    kind: Literal["good", "tag"]
+    id: int
+    name: str
+
+
 class GoodDetailRead(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     id: int
@@ -44,6 +50,11 @@ class GoodDetailFullCreate(BaseModel):
     image_id: Optional[str] = None
 
 
+class GoodDetailFullUpdate(GoodDetailFullCreate):
+    # Omitted: matched to an existing detail by content, then by position.
+    id: Optional[int] = None
+
+
 class GoodStyleRead(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     id: int
@@ -61,6 +72,11 @@ class GoodStyleFullCreate(BaseModel):
     image_id: Optional[str] = None
 
 
+class GoodStyleFullUpdate(GoodStyleFullCreate):
+    # Omitted: matched to an existing style by name, otherwise created.
+    id: Optional[int] = None
+
+
 class GoodFullRead(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     id: int
@@ -91,11 +107,59 @@ class GoodFullUpdate(BaseModel):
     description: Optional[str] = None
     price: Optional[int] = None
     image_id: Optional[str] = None
-    details: Optional[List[GoodDetailFullCreate]] = None
-    styles: Optional[List[GoodStyleFullCreate]] = None
+    details: Optional[List[GoodDetailFullUpdate]] = None
+    styles: Optional[List[GoodStyleFullUpdate]] = None
     tag_ids: Optional[List[int]] = None
 
 
+class FacetCount(BaseModel):
+    value: int
+    count: int
+
+
+class PriceFacetCount(BaseModel):
+    min: int
+    # Exclusive; None for the open-ended top bucket.
+    max: Optional[int] = None
+    count: int
+
+
+class GoodFacets(BaseModel):
+    stores: List[FacetCount]
+    tags: List[FacetCount]
+    prices: List[PriceFacetCount]
+
+
+class GoodStockUpdate(BaseModel):
+    style_id: Optional[int] = None
+    # None stops tracking stock.
+    stock: Optional[NonNegativeInt] = None
+
+
+class GoodStockRead(BaseModel):
+    good_id: int
+    style_id: Optional[int] = None
+    stock: Optional[int] = None
+    available: Optional[int] = None
+
+
+class GoodSalesRead(BaseModel):
+    good: GoodRead
+    count: int
+
+
+class GoodImportError(BaseModel):
+    line: int
+    error: str
+
+
+class GoodImportResult(BaseModel):
+    imported: int
+    failed: int
+    # At most the first 1000 failures.
+    errors: List[GoodImportError]
+
+
 class TagRead(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     id: int
@@ -1,5 +1,5 @@
 import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, PositiveInt
 
@@ -33,6 +33,7 @@ class OrderRead(BaseModel):
     total_price: int
     status: int
     address_id: int
+    expires_at: Optional[datetime.datetime] = None
     created_at: datetime.datetime
     updated_at: datetime.datetime
 
@@ -44,6 +45,7 @@ class OrderFullRead(BaseModel):
     total_price: int
     status: int
     address_id: int
+    expires_at: Optional[datetime.datetime] = None
     address: AddressRead
     order_items: List["OrderItemFullRead"]
     created_at: datetime.datetime
@@ -90,3 +92,10 @@ class OrderItemFullCreate(BaseModel):
     good_id: int
     style_id: Optional[int] = None
     count: PositiveInt
+
+
+class OrderTicketRead(BaseModel):
+    ticket: str
+    status: Literal["pending", "created", "failed"]
+    order_id: Optional[int] = None
+    detail: Optional[str] = None
@@ -0,0 +1,44 @@
+"""Pricing of order lines, shared by `POST /order/full` and the order intake consumer."""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.good import Good, GoodStyle
+from app.schemas.order import OrderItemFullCreate
+from app.services import stock
+
+# good id -> (price, stock); style id -> (good id, price, stock)
+Prices = Tuple[Dict[int, Tuple[int, Optional[int]]], Dict[int, Tuple[int, int, Optional[int]]]]
+
+
+def load_prices(db: Session, items: Iterable[OrderItemFullCreate]) -> Prices:
+    """Prices and stock of every good and style in `items`, in at most two queries."""
+    items = list(items)
+    good_ids = set(item.good_id for item in items)
+    style_ids = set(item.style_id for item in items if item.style_id)
+    goods = {good_id: (price, stock_) for good_id, price, stock_ in db.execute(
+        select(Good.id, Good.price, Good.stock).where(Good.id.in_(good_ids)))} if good_ids else {}
+    styles = {style_id: (good_id, price, stock_) for style_id, good_id, price, stock_ in db.execute(
+        select(GoodStyle.id, GoodStyle.good_id, GoodStyle.price, GoodStyle.stock)
+        .where(GoodStyle.id.in_(style_ids)))} if style_ids else {}
+    return goods, styles
+
+
+def price_items(items: Iterable[OrderItemFullCreate], prices: Prices) -> Tuple[List[dict], stock.Basket]:
+    """`OrderItem` rows without `order_id`, and the stock they need. Raises `ValueError` for unknown goods
+    or styles."""
+    goods, styles = prices
+    rows = []
+    basket = stock.Basket()
+    for item in items:
+        if item.good_id not in goods:
+            raise ValueError("Good not found.")
+        price, stock_ = goods[item.good_id]
+        if item.style_id:
+            style_good_id, price, stock_ = styles.get(item.style_id, (None, None, None))
+            if style_good_id != item.good_id:
+                raise ValueError("Style not found.")
+        rows.append({"good_id": item.good_id, "style_id": item.style_id, "count": item.count, "price": price})
+        basket.add(item.good_id, item.style_id, item.count, stock_)
+    return rows, basket
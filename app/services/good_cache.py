@@ -0,0 +1,80 @@
+"""Serialized `GoodFullRead` JSON per good, in a Redis hash `good_full:{id}` with the fields
+`body`, `updated_at` and `gen`.
+
+Writers bump `gen` and drop `body` after committing. Readers remember the `gen` they saw on a miss and
+only store the body they built if it is still current, so a read that started before a write can't put
+the old graph back. Bodies must be built from the primary: a lagging replica can still return the old graph
+after the bump, and it would pass the `gen` check. The TTL bounds staleness from changes that don't invalidate.
+"""
+import datetime
+from typing import Dict, List, Optional, Tuple
+
+from redis import Redis
+from redis.exceptions import RedisError, WatchError
+
+from app.utils.log_utils import logger
+from config import GOOD_CACHE_TTL_SECONDS
+
+
+def _key(good_id: int) -> str:
+    return f"good_full:{good_id}"
+
+
+Entry = Tuple[Optional[bytes], Optional[datetime.datetime], Optional[bytes]]
+
+
+def _entry(body, updated_at, gen) -> Entry:
+    if updated_at is not None:
+        updated_at = datetime.datetime.fromisoformat(updated_at.decode())
+    return body, updated_at, gen
+
+
+def get_body(rdb: Redis, good_id: int) -> Entry:
+    """Returns `(body, updated_at, gen)`; pass `gen` to `set_body` on a miss."""
+    try:
+        return _entry(*rdb.hmget(_key(good_id), ["body", "updated_at", "gen"]))
+    except RedisError as e:
+        logger.error(f"good_cache: failed to get {good_id}", exc_info=e)
+        return None, None, None
+
+
+def get_bodies(rdb: Redis, good_ids: List[int]) -> Dict[int, Entry]:
+    """`get_body` for many goods in one round trip."""
+    try:
+        pipe = rdb.pipeline(transaction=False)
+        for good_id in good_ids:
+            pipe.hmget(_key(good_id), ["body", "updated_at", "gen"])
+        return {good_id: _entry(*values) for good_id, values in zip(good_ids, pipe.execute())}
+    except RedisError as e:
+        logger.error(f"good_cache: failed to get {len(good_ids)} goods", exc_info=e)
+        return {good_id: (None, None, None) for good_id in good_ids}
+
+
+def set_body(rdb: Redis, good_id: int, body: bytes, updated_at: datetime.datetime, gen: Optional[bytes]):
+    key = _key(good_id)
+    try:
+        with rdb.pipeline() as pipe:
+            pipe.watch(key)
+            if pipe.hget(key, "gen") != gen:
+                return
+            pipe.multi()
+            pipe.hset(key, mapping={"body": body, "updated_at": updated_at.isoformat(), "gen": gen or 0})
+            pipe.expire(key, GOOD_CACHE_TTL_SECONDS)
+            pipe.execute()
+    except WatchError:
+        pass
+    except RedisError as e:
+        logger.error(f"good_cache: failed to set {good_id}", exc_info=e)
+
+
+def invalidate(rdb: Redis, *good_ids: int):
+    try:
+        pipe = rdb.pipeline()
+        for good_id in good_ids:
+            key = _key(good_id)
+            pipe.hincrby(key, "gen", 1)
+            pipe.hdel(key, "body", "updated_at")
+            pipe.expire(key, GOOD_CACHE_TTL_SECONDS)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"good_cache: failed to invalidate {good_ids}", exc_info=e)
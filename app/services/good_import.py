@@ -0,0 +1,143 @@
+import codecs
+import csv
+import json
+from typing import BinaryIO, Iterator, List, Tuple
+
+from pydantic import ValidationError
+from redis import Redis
+from sqlalchemy import select, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.models.good import Good, GoodDetail, GoodStyle, TagGoodLink, Tag
+from app.models.store import Store
+from app.models.user import User, Role
+from app.schemas.good import GoodFullCreate, GoodImportResult, GoodImportError
+from app.services import suggest
+from app.services.random_pool import random_goods
+from app.utils.log_utils import logger
+
+# Goods per transaction.
+IMPORT_CHUNK = 1000
+MAX_REPORTED_ERRORS = 1000
+# CSV cells holding JSON, since a flat row can't nest.
+_CSV_JSON_FIELDS = ("details", "styles", "tag_ids")
+
+Record = Tuple[int, dict | str]
+
+
+def jsonl_records(f: BinaryIO) -> Iterator[Record]:
+    for line_no, line in enumerate(f, 1):
+        try:
+            line = line.decode("utf-8-sig" if line_no == 1 else "utf-8")
+            if line.strip():
+                yield line_no, json.loads(line)
+        except ValueError as e:  # covers UnicodeDecodeError and JSONDecodeError
+            yield line_no, f"Invalid JSON: {e}"
+
+
+def csv_records(f: BinaryIO) -> Iterator[Record]:
+    reader = csv.DictReader(codecs.iterdecode(f, "utf-8-sig"))
+    try:
+        for row in reader:
+            try:
+                record = {k: v for k, v in row.items() if k and v}
+                for key in _CSV_JSON_FIELDS:
+                    if key in record:
+                        record[key] = json.loads(record[key])
+                record.setdefault("details", [])
+                record.setdefault("styles", [])
+                yield reader.line_num, record
+            except ValueError as e:
+                yield reader.line_num, f"Invalid JSON cell: {e}"
+    except UnicodeDecodeError as e:
+        yield reader.line_num + 1, f"Not UTF-8, import stopped: {e}"
+
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+
+
+class GoodImporter:
+    """Inserts `GoodFullCreate` records in chunks of `IMPORT_CHUNK`, one transaction per chunk.
+
+    Goods go in as one INSERT, their ids read back with RETURNING where the dialect has it, and otherwise
+    counted up from `lastrowid` (see `_insert_goods`); details, styles and tag links are then inserted with
+    one executemany each. A database error fails its whole chunk, while earlier chunks stay committed.
+    """
+
+    def __init__(self, db: Session, rdb: Redis, user: User):
+        self.db = db
+        self.rdb = rdb
+        self.tag_ids = set(db.execute(select(Tag.id)).scalars())
+        store_query = select(Store.id)
+        if user.role != Role.Admin:
+            store_query = store_query.where(Store.owner_id == user.id)
+        self.store_ids = set(db.execute(store_query).scalars())
+        self.result = GoodImportResult(imported=0, failed=0, errors=[])
+
+    def _fail(self, line: int, error: str):
+        self.result.failed += 1
+        if len(self.result.errors) < MAX_REPORTED_ERRORS:
+            self.result.errors.append(GoodImportError(line=line, error=error))
+
+    def _validate(self, record: dict | str) -> GoodFullCreate | str:
+        if isinstance(record, str):
+            return record
+        try:
+            good = GoodFullCreate.model_validate(record)
+        except ValidationError as e:
+            return _validation_message(e)
+        if good.store_id not in self.store_ids:
+            return "Store not found."
+        missing = set(good.tag_ids or []) - self.tag_ids
+        if missing:
+            return f"Tag not found: {sorted(missing)}"
+        return good
+
+    def _insert_goods(self, rows: List[dict]) -> List[int]:
+        """The ids of the inserted goods, in the order of `rows`."""
+        if self.db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+            return list(self.db.scalars(insert(Good).returning(Good.id, sort_by_parameter_order=True), rows))
+        # MySQL: a multi-row INSERT reports its first id, and with innodb_autoinc_lock_mode 0 or 1 (not the
+        # interleaved 2) the statement's ids are consecutive.
+        first_id = self.db.execute(insert(Good).values(rows)).lastrowid
+        return list(range(first_id, first_id + len(rows)))
+
+    def _insert_chunk(self, chunk: List[Tuple[int, GoodFullCreate]]):
+        try:
+            good_ids = self._insert_goods([g.model_dump(exclude={"details", "styles", "tag_ids"}) for _, g in chunk])
+            created = [(good_id, g.name) for good_id, (_, g) in zip(good_ids, chunk)]
+            details, styles, links = [], [], []
+            for good_id, (_, g) in zip(good_ids, chunk):
+                details += [{**d.model_dump(), "good_id": good_id} for d in g.details]
+                styles += [{**s.model_dump(), "good_id": good_id} for s in g.styles]
+                links += [{"tag_id": tag_id, "good_id": good_id} for tag_id in set(g.tag_ids or [])]
+            for model, rows in ((GoodDetail, details), (GoodStyle, styles), (TagGoodLink, links)):
+                if rows:
+                    self.db.execute(insert(model), rows)
+            self.db.commit()
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"import_goods: failed to insert lines {chunk[0][0]}-{chunk[-1][0]}", exc_info=e)
+            for line, _ in chunk:
+                self._fail(line, f"Database error: {e.__class__.__name__}")
+            return
+        self.result.imported += len(created)
+        random_goods.add(self.rdb, *[good_id for good_id, _ in created])
+        suggest.add_many(self.rdb, "good", created)
+
+    def run(self, records: Iterator[Record]) -> GoodImportResult:
+        chunk = []
+        for line, record in records:
+            good = self._validate(record)
+            if isinstance(good, str):
+                self._fail(line, good)
+                continue
+            chunk.append((line, good))
+            if len(chunk) >= IMPORT_CHUNK:
+                self._insert_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._insert_chunk(chunk)
+        return self.result
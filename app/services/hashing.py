@@ -0,0 +1,85 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.utils.log_utils import logger
+from config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt runs in a dedicated process pool so that a login storm neither occupies the AnyIO threadpool
+# nor competes for the GIL with normal API traffic. Submissions are only made from the event loop thread,
+# so the counters below need no lock.
+_executor: Optional[ProcessPoolExecutor] = None
+_pending = 0
+_stats = {"count": 0, "rejected": 0, "seconds_total": 0.0, "seconds_max": 0.0}
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # Not fork: by now this process runs background threads (listeners, refreshers, consumers), and a
+        # forked child can deadlock on a lock one of them held at the time.
+        _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS,
+                                        mp_context=multiprocessing.get_context("forkserver"))
+    return _executor
+
+
+async def _submit(fn, *args):
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        _stats["rejected"] += 1
+        logger.warning(f"hashing: queue full ({_pending} pending), rejecting request")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Server busy, please retry later.", headers={"Retry-After": "1"})
+    _pending += 1
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _pending -= 1
+        elapsed = time.perf_counter() - start
+        _stats["count"] += 1
+        _stats["seconds_total"] += elapsed
+        _stats["seconds_max"] = max(_stats["seconds_max"], elapsed)
+
+
+async def hash_password(password: str) -> str:
+    return await _submit(_hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await _submit(_verify, password, hashed_password)
+
+
+def stats() -> dict:
+    count = _stats["count"]
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_pending": PASSWORD_HASH_MAX_PENDING,
+        "pending": _pending,
+        "count": count,
+        "rejected": _stats["rejected"],
+        "seconds_avg": _stats["seconds_total"] / count if count else 0.0,
+        "seconds_max": _stats["seconds_max"],
+    }
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,161 @@
+"""Bestseller leaderboards: Redis sorted sets of good ids scored by units sold.
+
+Keys are `top:{metric}:{scope}:{window}`:
+- `metric` is `ordered` (counted when an order is placed) or `paid` (when it is paid);
+- `scope` is `all`, `store:{id}` or `tag:{id}`;
+- `window` is `all`, `d{yyyymmdd}` or `w{yyyy}{ww}` (ISO week).
+Day and week keys expire once their window is over, so a top-N read is one `ZREVRANGE` over the current key.
+
+Counting is best-effort: a Redis error loses that order's increments until the next
+`python -m app.services.leaderboard rebuild`, which reseeds every set from `order_item`.
+"""
+import argparse
+import datetime
+from collections import defaultdict
+from typing import Dict, List, Literal, Optional, Tuple
+
+from redis import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from app.models.good import Good, TagGoodLink
+from app.models.order import OrderItem
+from app.models.pay import Payment
+from app.schemas.good import GoodRead, GoodSalesRead
+from app.utils.log_utils import logger
+
+Metric = Literal["ordered", "paid"]
+Window = Literal["day", "week", "all"]
+METRICS = ("ordered", "paid")
+_KEY_PREFIX = "top:"
+_REBUILD_CHUNK = 10000
+# Kept a bit past the end of their window, for clock skew between workers.
+_WINDOW_TTL = {"day": datetime.timedelta(days=2), "week": datetime.timedelta(days=8)}
+
+
+def _window_suffix(window: Window, when: datetime.datetime) -> str:
+    if window == "day":
+        return when.strftime("d%Y%m%d")
+    if window == "week":
+        year, week, _ = when.isocalendar()
+        return f"w{year}{week:02d}"
+    return "all"
+
+
+def _window_start(window: Window, now: datetime.datetime) -> Optional[datetime.datetime]:
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == "day":
+        return day
+    if window == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    return None
+
+
+def key(metric: Metric, scope: str, window: Window, when: Optional[datetime.datetime] = None) -> str:
+    return f"{_KEY_PREFIX}{metric}:{scope}:{_window_suffix(window, when or datetime.datetime.now())}"
+
+
+def _scopes(db: Session, good_ids: List[int]) -> Dict[int, List[str]]:
+    scopes = {good_id: ["all"] for good_id in good_ids}
+    for good_id, store_id in db.execute(select(Good.id, Good.store_id).where(Good.id.in_(good_ids))):
+        scopes[good_id].append(f"store:{store_id}")
+    for good_id, tag_id in db.execute(select(TagGoodLink.good_id, TagGoodLink.tag_id)
+                                      .where(TagGoodLink.good_id.in_(good_ids))):
+        scopes[good_id].append(f"tag:{tag_id}")
+    return scopes
+
+
+def record(rdb: Redis, db: Session, metric: Metric, counts: List[Tuple[int, int]]):
+    """Adds `(good_id, units)` pairs to every board the goods are on. Never raises."""
+    totals = defaultdict(int)
+    for good_id, count in counts:
+        totals[good_id] += count
+    if not totals:
+        return
+    now = datetime.datetime.now()
+    try:
+        scopes = _scopes(db, list(totals))
+        pipe = rdb.pipeline(transaction=False)
+        for window in ("day", "week", "all"):
+            for good_id, count in totals.items():
+                for scope in scopes[good_id]:
+                    pipe.zincrby(key(metric, scope, window, now), count, good_id)
+            if window in _WINDOW_TTL:
+                ttl = _WINDOW_TTL[window]
+                for scope in {scope for good_scopes in scopes.values() for scope in good_scopes}:
+                    pipe.expire(key(metric, scope, window, now), ttl)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"leaderboard: failed to record {metric} {dict(totals)}", exc_info=e)
+
+
+def top(rdb: Redis, metric: Metric, scope: str, window: Window, n: int) -> List[Tuple[int, int]]:
+    """`(good_id, units)` pairs, best first."""
+    try:
+        return [(int(good_id), int(score))
+                for good_id, score in rdb.zrevrange(key(metric, scope, window), 0, n - 1, withscores=True)]
+    except RedisError as e:
+        logger.error(f"leaderboard: failed to read {metric} {scope} {window}", exc_info=e)
+        return []
+
+
+def top_goods(rdb: Redis, db: Session, metric: Metric, scope: str, window: Window, n: int) -> List[GoodSalesRead]:
+    ranked = top(rdb, metric, scope, window, n)
+    if not ranked:
+        return []
+    goods = {good.id: good for good in db.execute(select(Good).where(Good.id.in_([i for i, _ in ranked]))).scalars()}
+    # Deleted goods stay on the boards until they age out or the next rebuild.
+    return [GoodSalesRead(good=GoodRead.model_validate(goods[good_id]), count=count)
+            for good_id, count in ranked if good_id in goods]
+
+
+def _sales(db: Session, metric: Metric, since: Optional[datetime.datetime]) -> List[Tuple[int, int]]:
+    query = select(OrderItem.good_id, func.sum(OrderItem.count)).group_by(OrderItem.good_id)
+    created_at = OrderItem.created_at
+    if metric == "paid":
+        query = query.join(Payment, Payment.order_id == OrderItem.order_id)
+        created_at = Payment.created_at
+    if since is not None:
+        query = query.where(created_at >= since)
+    return [(good_id, int(count)) for good_id, count in db.execute(query)]
+
+
+def rebuild(rdb: Redis, db: Session):
+    """Recomputes the current day, week and all-time boards from `order_item` and swaps them in."""
+    now = datetime.datetime.now()
+    boards: Dict[str, Dict[int, int]] = defaultdict(dict)
+    ttls = {}
+    # Every good sold at all has an "ordered" all-time count.
+    sold = [good_id for good_id, _ in _sales(db, "ordered", None)]
+    scopes = {}
+    for i in range(0, len(sold), _REBUILD_CHUNK):
+        scopes |= _scopes(db, sold[i:i + _REBUILD_CHUNK])
+    for metric in METRICS:
+        for window in ("day", "week", "all"):
+            for good_id, count in _sales(db, metric, _window_start(window, now)):
+                for scope in scopes[good_id]:
+                    board_key = key(metric, scope, window, now)
+                    boards[board_key][good_id] = count
+                    if window in _WINDOW_TTL:
+                        ttls[board_key] = _WINDOW_TTL[window]
+    # Increments that land between the queries above and this swap are lost.
+    pipe = rdb.pipeline()
+    for old_key in rdb.scan_iter(match=f"{_KEY_PREFIX}*", count=1000):
+        pipe.delete(old_key)
+    for board_key, scores in boards.items():
+        pipe.zadd(board_key, scores)
+        if board_key in ttls:
+            pipe.expire(board_key, ttls[board_key])
+    pipe.execute()
+    logger.info(f"leaderboard: rebuilt {len(boards)} boards")
+
+
+if __name__ == "__main__":
+    from app.db import engine, redis_pool
+
+    parser = argparse.ArgumentParser(prog="python -m app.services.leaderboard")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+    with Session(engine) as session:
+        rebuild(Redis(connection_pool=redis_pool), session)
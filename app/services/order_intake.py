@@ -0,0 +1,308 @@
+"""Asynchronous order intake, for traffic spikes (`order_intake.enabled`).
+
+`POST /order/full` and `/order/direct-buy` only validate the request body, then append it to the Redis
+stream `order_intake` and answer 202 with a ticket. Consumers in the `order_intake` group read the stream in
+batches and place every order of a batch in one transaction, with one executemany for all of its items.
+Each ticket's hash `order_intake:{ticket}` then holds `created` and the order id, or `failed` and why, and
+the result is published on a channel of the same name for `GET /order/intake/{ticket}?wait=`. Each worker
+serves its long-polls from a single pattern subscription, so that waiting clients don't hold Redis connections.
+
+Entries are acknowledged and deleted once their results are written. A consumer that dies mid-batch
+leaves its entries pending, and another consumer claims them after `_CLAIM_IDLE_MS`. Tickets that already
+have a result are skipped, so only a crash between the commit and the result write places an order twice.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+from redis import Redis
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy import select, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.db import engine, redis_pool, async_redis_pool
+from app.models.order import Order, OrderItem
+from app.models.user import Address, User, Role
+from app.schemas.order import OrderFullCreate, OrderTicketRead
+from app.services import checkout, leaderboard, stock
+from app.utils.log_utils import logger
+from config import ORDER_INTAKE_BATCH_SIZE, ORDER_INTAKE_BLOCK_MS, ORDER_INTAKE_TICKET_TTL_SECONDS, \
+    ORDER_INTAKE_CONSUMERS
+
+STREAM_KEY = "order_intake"
+GROUP = "order_intake"
+_CLAIM_IDLE_MS = 60000
+
+
+def _ticket_key(ticket: str) -> str:
+    return f"order_intake:{ticket}"
+
+
+def _ticket_read(ticket: str, fields: dict) -> OrderTicketRead:
+    fields = {k.decode(): v.decode() for k, v in fields.items()}
+    return OrderTicketRead(ticket=ticket, status=fields["status"], order_id=fields.get("order_id"),
+                           detail=fields.get("detail"))
+
+
+def submit(rdb: Redis, user: User, order_dict: OrderFullCreate) -> Optional[OrderTicketRead]:
+    """Queues the order; None when Redis is unavailable, so the caller can place it synchronously."""
+    ticket = uuid.uuid4().hex
+    key = _ticket_key(ticket)
+    try:
+        pipe = rdb.pipeline()
+        pipe.hset(key, mapping={"status": "pending", "user_id": user.id})
+        pipe.expire(key, ORDER_INTAKE_TICKET_TTL_SECONDS)
+        pipe.xadd(STREAM_KEY, {"ticket": ticket, "user_id": user.id, "admin": int(user.role == Role.Admin),
+                               "order": order_dict.model_dump_json()})
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"order_intake: failed to queue an order of user {user.id}", exc_info=e)
+        return None
+    return OrderTicketRead(ticket=ticket, status="pending")
+
+
+# Long-polls of this worker, woken by one pattern subscription instead of holding a pub/sub connection each.
+_waiters: Dict[str, Set[asyncio.Future]] = {}
+_listener: Optional[asyncio.Task] = None
+_subscribed: Optional[asyncio.Event] = None
+
+
+def _wake(ticket: Optional[str] = None):
+    for ticket_ in ([ticket] if ticket is not None else list(_waiters)):
+        for future in _waiters.pop(ticket_, ()):
+            if not future.done():
+                future.set_result(None)
+
+
+async def _listen():
+    rdb = aioredis.Redis(connection_pool=async_redis_pool)
+    prefix = _ticket_key("")
+    while True:
+        try:
+            async with rdb.pubsub() as pubsub:
+                await pubsub.psubscribe(_ticket_key("*"))
+                _subscribed.set()
+                while True:
+                    # A timeout, not listen(): an idle subscription must not trip the socket timeout.
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+                    if message is not None:
+                        _wake(message["channel"].decode().removeprefix(prefix))
+        except Exception as e:
+            _subscribed.clear()
+            logger.error(f"order_intake: ticket listener failed", exc_info=e)
+            # Results may have been missed while disconnected; the waiters read their tickets again.
+            _wake()
+            await asyncio.sleep(1)
+
+
+def _start_listener():
+    global _listener, _subscribed
+    if _listener is None or _listener.done():
+        _subscribed = asyncio.Event()
+        _listener = asyncio.create_task(_listen())
+
+
+async def stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        _listener = None
+    _wake()
+
+
+async def get_ticket(rdb: aioredis.Redis, ticket: str, wait: float) -> Optional[Tuple[int, OrderTicketRead]]:
+    """`(user_id, ticket)`, waiting up to `wait` seconds for a pending ticket to settle. None if unknown."""
+    key = _ticket_key(ticket)
+    fields = await rdb.hgetall(key)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while fields.get(b"status") == b"pending" and deadline > loop.time():
+        _start_listener()
+        try:
+            await asyncio.wait_for(_subscribed.wait(), deadline - loop.time())
+        except asyncio.TimeoutError:
+            break
+        future = loop.create_future()
+        _waiters.setdefault(ticket, set()).add(future)
+        try:
+            # Read again once registered and subscribed, so that a result published in between isn't missed.
+            fields = await rdb.hgetall(key)
+            if fields.get(b"status") == b"pending":
+                await asyncio.wait_for(future, deadline - loop.time())
+                fields = await rdb.hgetall(key)
+        except asyncio.TimeoutError:
+            break
+        finally:
+            waiters = _waiters.get(ticket)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del _waiters[ticket]
+    if not fields:
+        return None
+    return int(fields[b"user_id"]), _ticket_read(ticket, fields)
+
+
+class _Request:
+
+    def __init__(self, entry_id: bytes, fields: dict):
+        self.entry_id = entry_id
+        self.ticket = fields[b"ticket"].decode()
+        self.user_id = int(fields[b"user_id"])
+        self.admin = fields[b"admin"] == b"1"
+        self.order_dict = OrderFullCreate.model_validate_json(fields[b"order"])
+        self.result = {}
+        self.order: Optional[Order] = None
+        self.rows: List[dict] = []
+        self.basket: Optional[stock.Basket] = None
+
+    def fail(self, detail: str):
+        self.result = {"status": "failed", "detail": detail}
+        self.order = None
+
+
+def process(rdb: Redis, db: Session, entries: list):
+    """Places a batch of stream entries as orders in one transaction, then writes and publishes the results."""
+    requests = []
+    for entry_id, fields in entries:
+        try:
+            requests.append(_Request(entry_id, fields))
+        except (KeyError, ValueError) as e:
+            logger.error(f"order_intake: dropping malformed entry {entry_id}", exc_info=e)
+    # Already settled by a consumer that died before acknowledging.
+    pipe = rdb.pipeline(transaction=False)
+    for request in requests:
+        pipe.hget(_ticket_key(request.ticket), "status")
+    requests = [request for request, status in zip(requests, pipe.execute()) if status == b"pending"]
+
+    prices = checkout.load_prices(db, [item for request in requests for item in request.order_dict.goods])
+    address_ids = set(request.order_dict.address_id for request in requests)
+    address_users = dict(db.execute(select(Address.id, Address.user_id)
+                                    .where(Address.id.in_(address_ids))).tuples().all()) if address_ids else {}
+    for request in requests:
+        address_user_id = address_users.get(request.order_dict.address_id)
+        if address_user_id is None or (not request.admin and address_user_id != request.user_id):
+            request.fail("Address not found.")
+            continue
+        try:
+            request.rows, request.basket = checkout.price_items(request.order_dict.goods, prices)
+        except ValueError as e:
+            request.fail(str(e))
+            continue
+        request.order = Order(**request.order_dict.model_dump(exclude={"goods"}), user_id=request.user_id,
+                              total_price=sum(row["price"] * row["count"] for row in request.rows))
+        db.add(request.order)
+    placed = [request for request in requests if request.order is not None]
+    reserved = []
+    try:
+        # MySQL can't return the ids of a multi-row INSERT, so orders are inserted one by one; they still
+        # share the transaction, and the items go in one executemany.
+        db.flush()
+        for request in placed:
+            if not request.basket:
+                continue
+            try:
+                short_sku, request.order.expires_at = stock.reserve(rdb, request.order.id, request.basket)
+            except RedisError as e:
+                logger.error(f"order_intake: failed to reserve stock for ticket {request.ticket}", exc_info=e)
+                short_sku = ""
+            if short_sku is not None:
+                db.delete(request.order)
+                request.fail("Out of stock." if short_sku else "Stock unavailable, retry.")
+            else:
+                reserved.append(request.order.id)
+        placed = [request for request in placed if request.order is not None]
+        rows = [{**row, "order_id": request.order.id} for request in placed for row in request.rows]
+        if rows:
+            db.execute(insert(OrderItem.__table__), rows)
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"order_intake: failed to place {len(placed)} orders", exc_info=e)
+        stock.release_unplaced(rdb, *reserved)
+        for request in placed:
+            request.fail("Database error, retry.")
+        placed = []
+    for request in placed:
+        request.result = {"status": "created", "order_id": request.order.id}
+
+    pipe = rdb.pipeline()
+    for request in requests:
+        key = _ticket_key(request.ticket)
+        pipe.hset(key, mapping=request.result)
+        pipe.expire(key, ORDER_INTAKE_TICKET_TTL_SECONDS)
+        pipe.publish(key, request.result["status"])
+    entry_ids = [entry_id for entry_id, _ in entries]
+    pipe.xack(STREAM_KEY, GROUP, *entry_ids)
+    pipe.xdel(STREAM_KEY, *entry_ids)
+    pipe.execute()
+    leaderboard.record(rdb, db, "ordered", [(row["good_id"], row["count"]) for request in placed
+                                            for row in request.rows])
+
+
+def _ensure_group(rdb: Redis):
+    try:
+        rdb.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def consume(rdb: Redis, consumer: str, stop: threading.Event):
+    _ensure_group(rdb)
+    while not stop.is_set():
+        try:
+            # Entries left pending by a consumer that died go first.
+            _, entries, *_ = rdb.xautoclaim(STREAM_KEY, GROUP, consumer, _CLAIM_IDLE_MS,
+                                            count=ORDER_INTAKE_BATCH_SIZE)
+            entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+            if not entries:
+                read = rdb.xreadgroup(GROUP, consumer, {STREAM_KEY: ">"}, count=ORDER_INTAKE_BATCH_SIZE,
+                                      block=ORDER_INTAKE_BLOCK_MS)
+                entries = read[0][1] if read else []
+            if entries:
+                with Session(engine) as db:
+                    process(rdb, db, entries)
+        except Exception as e:
+            logger.error(f"order_intake: consumer {consumer} failed", exc_info=e)
+            stop.wait(1)
+
+
+def _consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+
+
+_stop = threading.Event()
+_threads: List[threading.Thread] = []
+
+
+def _run():
+    consume(Redis(connection_pool=redis_pool), _consumer_name(), _stop)
+
+
+def start_consumers():
+    if _threads:
+        return
+    for i in range(ORDER_INTAKE_CONSUMERS):
+        _threads.append(threading.Thread(target=_run, name=f"order-intake-{i}", daemon=True))
+        _threads[-1].start()
+
+
+def stop_consumers():
+    _stop.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m app.services.order_intake",
+                                     description="Runs an order intake consumer until interrupted.")
+    parser.parse_args()
+    try:
+        consume(Redis(connection_pool=redis_pool), _consumer_name(), _stop)
+    except KeyboardInterrupt:
+        pass
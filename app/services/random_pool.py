@@ -0,0 +1,123 @@
+import random
+import threading
+from typing import List, Optional
+
+from redis import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db import redis_pool, replica_router
+from app.models.good import Good, Tag
+from app.utils.log_utils import logger
+from config import RANDOM_POOL_REFRESH_SECONDS
+
+_REBUILD_CHUNK = 10000
+
+
+class RandomPool:
+    """A Redis set holding every id of `model`, so that random picks are `SRANDMEMBER` plus a primary key lookup.
+
+    The set is kept current on create/delete and fully rebuilt every `RANDOM_POOL_REFRESH_SECONDS`
+    by whichever worker grabs the rebuild lock first. Creates and deletes are also journaled, and a rebuild
+    replays the journal of its own run and of the interval before it, which the (replica) scan may have missed.
+    """
+
+    def __init__(self, key: str, model):
+        self.key = key
+        self.model = model
+        self._journal = {op: f"{key}:{op}" for op in ("added", "removed")}
+
+    def sample(self, rdb: Redis, k: int) -> List[int]:
+        try:
+            return [int(i) for i in rdb.srandmember(self.key, k)]
+        except RedisError as e:
+            logger.error(f"random_pool: failed to sample {self.key}", exc_info=e)
+            return []
+
+    def _change(self, rdb: Redis, op: str, ids: tuple):
+        undo = "removed" if op == "added" else "added"
+        pipe = rdb.pipeline()
+        (pipe.sadd if op == "added" else pipe.srem)(self.key, *ids)
+        pipe.sadd(self._journal[op], *ids)
+        pipe.srem(self._journal[undo], *ids)
+        # Rotated away by every rebuild; the TTL only matters once rebuilds stop.
+        pipe.expire(self._journal[op], RANDOM_POOL_REFRESH_SECONDS * 3)
+        pipe.execute()
+
+    def add(self, rdb: Redis, *ids: int):
+        try:
+            self._change(rdb, "added", ids)
+        except RedisError as e:
+            logger.error(f"random_pool: failed to add {ids} to {self.key}", exc_info=e)
+
+    def remove(self, rdb: Redis, *ids: int):
+        try:
+            self._change(rdb, "removed", ids)
+        except RedisError as e:
+            logger.error(f"random_pool: failed to remove {ids} from {self.key}", exc_info=e)
+
+    def rebuild(self, rdb: Redis, db: Session):
+        tmp_key = f"{self.key}:rebuild"
+        rdb.delete(tmp_key)
+        # Changes from now on go to a fresh journal; the previous one covers the lag of the scan's replica.
+        for journal in self._journal.values():
+            if rdb.exists(journal):
+                rdb.rename(journal, f"{journal}:prev")
+            else:
+                rdb.delete(f"{journal}:prev")
+        last_id, total = 0, 0
+        while True:
+            ids = db.execute(select(self.model.id).where(self.model.id > last_id)
+                             .order_by(self.model.id).limit(_REBUILD_CHUNK)).scalars().all()
+            if not ids:
+                break
+            rdb.sadd(tmp_key, *ids)
+            last_id, total = ids[-1], total + len(ids)
+        pipe = rdb.pipeline()
+        if total:
+            pipe.rename(tmp_key, self.key)
+        else:
+            pipe.delete(self.key)
+        for suffix in (":prev", ""):
+            pipe.sunionstore(self.key, [self.key, self._journal["added"] + suffix])
+            pipe.sdiffstore(self.key, [self.key, self._journal["removed"] + suffix])
+        pipe.execute()
+
+    def refresh(self, rdb: Redis, db: Session):
+        # Rebuild when the lock is free (once per interval across workers) or when the set is missing.
+        lock = rdb.set(f"{self.key}:lock", 1, nx=True, ex=RANDOM_POOL_REFRESH_SECONDS)
+        if lock or not rdb.exists(self.key):
+            self.rebuild(rdb, db)
+
+
+random_goods = RandomPool("random_pool:good", Good)
+random_tags = RandomPool("random_pool:tag", Tag)
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _run():
+    rdb = Redis(connection_pool=redis_pool)
+    while True:
+        for pool in (random_goods, random_tags):
+            try:
+                with Session(replica_router.pick()) as db:
+                    pool.refresh(rdb, db)
+            except Exception as e:
+                logger.error(f"random_pool: failed to refresh {pool.key}", exc_info=e)
+        # Jitter keeps the workers from polling the lock in lockstep.
+        if _stop.wait(RANDOM_POOL_REFRESH_SECONDS * random.uniform(0.5, 1.0)):
+            break
+
+
+def start_refresher():
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=_run, name="random-pool", daemon=True)
+        _thread.start()
+
+
+def stop_refresher():
+    _stop.set()
@@ -0,0 +1,165 @@
+""""Customers also bought" for `/good/{good_id}/related`, computed in each worker and served from its memory.
+
+`C = Bᵀ·B`, where `B` is the binary order-by-good incidence matrix, counts for every pair of goods the orders
+containing both, and its diagonal the orders containing each good. Neighbours are ranked by cosine similarity
+`C[i, j] / sqrt(C[i, i] * C[j, j])`, and the top `RECOMMEND_TOP_K` of each good are kept.
+
+Orders are read in chunks of `_CHUNK_ORDERS` past a watermark on `order.id`, so a refresh only reads new
+orders. Ids are allocated at insert, not at commit, so an order can become visible (on the primary, or later
+on a lagging replica) after higher ids were already read. Each refresh therefore reads again the last
+`_OVERLAP_ORDERS` ids below the watermark and skips the orders it has already counted. An order is missed
+only if it becomes visible after more than `_OVERLAP_ORDERS` later ids were read; it then waits for the next
+rebuild. Memory is bounded by `RECOMMEND_MAX_PAIRS`: past it, the rarest pairs are pruned from `C`. Changes
+that increments miss (late orders past the overlap, pruned pairs, edited or deleted orders, normalization
+drift of untouched goods) are repaired by a full rebuild every `RECOMMEND_REBUILD_SECONDS`. So a change is
+at most `RECOMMEND_REFRESH_SECONDS` late, and at worst `RECOMMEND_REBUILD_SECONDS`.
+"""
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db import replica_router
+from app.models.order import Order, OrderItem
+from app.utils.log_utils import logger
+from config import RECOMMEND_REFRESH_SECONDS, RECOMMEND_REBUILD_SECONDS, RECOMMEND_TOP_K, RECOMMEND_MAX_PAIRS
+
+_CHUNK_ORDERS = 10000
+# Ids re-read below the watermark, for orders committed after higher ids.
+_OVERLAP_ORDERS = 10000
+
+
+class CoPurchaseModel:
+
+    def __init__(self):
+        self.counts = sp.csr_matrix((0, 0), dtype=np.int32)
+        self.last_order_id = 0
+        # Ids counted within `_OVERLAP_ORDERS` of the watermark, the only ones read again.
+        self.counted = set()
+        # good id -> (neighbour ids, scores), best first
+        self.related: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _read_chunk(self, db: Session, after: int) -> Optional[Tuple[np.ndarray, np.ndarray, int, int]]:
+        """`(order ids, good ids)` of the items of orders not counted yet among the next chunk past `after`,
+        then the chunk's last id and how many orders were new."""
+        order_ids = db.execute(select(Order.id).where(Order.id > after)
+                               .order_by(Order.id).limit(_CHUNK_ORDERS)).scalars().all()
+        if not order_ids:
+            return None
+        new = [order_id for order_id in order_ids if order_id not in self.counted]
+        rows = db.execute(select(OrderItem.order_id, OrderItem.good_id)
+                          .where(OrderItem.order_id > after)
+                          .where(OrderItem.order_id <= order_ids[-1])).all()
+        pairs = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        pairs = pairs[np.isin(pairs[:, 0], new)]
+        self.counted.update(new)
+        return pairs[:, 0], pairs[:, 1], order_ids[-1], len(new)
+
+    def _add(self, order_ids: np.ndarray, good_ids: np.ndarray):
+        _, order_rows = np.unique(order_ids, return_inverse=True)
+        n = max(self.counts.shape[0], int(good_ids.max()) + 1)
+        incidence = sp.csr_matrix((np.ones(len(good_ids), dtype=np.int32), (order_rows, good_ids)),
+                                  shape=(int(order_rows.max()) + 1, n))
+        # A good bought in several styles counts once per order.
+        incidence.sum_duplicates()
+        incidence.data[:] = 1
+        self.counts.resize((n, n))
+        self.counts = (self.counts + (incidence.T @ incidence).tocsr()).astype(np.int32)
+        if self.counts.nnz > RECOMMEND_MAX_PAIRS:
+            self._prune()
+
+    def _prune(self):
+        coo = self.counts.tocoo()
+        diagonal = coo.row == coo.col
+        off = coo.data[~diagonal]
+        budget = max(RECOMMEND_MAX_PAIRS - int(diagonal.sum()), 0)
+        if budget >= len(off):
+            return
+        # Keeps pairs strictly above the budget-th largest count, so ties never push it over.
+        cutoff = np.partition(off, len(off) - budget - 1)[len(off) - budget - 1]
+        keep = diagonal | (coo.data > cutoff)
+        self.counts = sp.csr_matrix((coo.data[keep], (coo.row[keep], coo.col[keep])), shape=self.counts.shape)
+        logger.info(f"recommend: pruned pairs bought together {cutoff} times or less, {self.counts.nnz} left")
+
+    def _rank(self, good_ids: np.ndarray):
+        counts, diagonal = self.counts, self.counts.diagonal().astype(np.float64)
+        for good_id in good_ids:
+            start, end = counts.indptr[good_id], counts.indptr[good_id + 1]
+            neighbours, together = counts.indices[start:end], counts.data[start:end]
+            others = neighbours != good_id
+            neighbours, together = neighbours[others], together[others]
+            if not len(neighbours):
+                self.related.pop(int(good_id), None)
+                continue
+            scores = together / np.sqrt(diagonal[good_id] * diagonal[neighbours])
+            top = np.argpartition(-scores, min(RECOMMEND_TOP_K, len(scores)) - 1)[:RECOMMEND_TOP_K]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            self.related[int(good_id)] = neighbours[top], scores[top]
+
+    def update(self, db: Session) -> int:
+        """Folds in orders past the watermark; returns how many were read."""
+        total = 0
+        touched = []
+        after = max(self.last_order_id - _OVERLAP_ORDERS, 0)
+        while chunk := self._read_chunk(db, after):
+            order_ids, good_ids, after, new = chunk
+            total += new
+            self.last_order_id = max(self.last_order_id, after)
+            floor = self.last_order_id - _OVERLAP_ORDERS
+            self.counted = {order_id for order_id in self.counted if order_id > floor}
+            if len(good_ids):
+                self._add(order_ids, good_ids)
+                touched.append(good_ids)
+        if touched:
+            self._rank(np.unique(np.concatenate(touched)))
+        return total
+
+    def get(self, good_id: int, k: int) -> List[int]:
+        neighbours, _ = self.related.get(good_id, ((), ()))
+        return [int(i) for i in neighbours[:k]]
+
+
+_model = CoPurchaseModel()
+
+
+def related(good_id: int, k: int) -> List[int]:
+    return _model.get(good_id, k)
+
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _run():
+    global _model
+    rebuilt_at = time.monotonic()
+    while True:
+        try:
+            with Session(replica_router.pick()) as db:
+                if time.monotonic() - rebuilt_at >= RECOMMEND_REBUILD_SECONDS:
+                    # Built aside and swapped in, requests keep the old model meanwhile.
+                    model = CoPurchaseModel()
+                    model.update(db)
+                    _model, rebuilt_at = model, time.monotonic()
+                else:
+                    _model.update(db)
+        except Exception as e:
+            logger.error(f"recommend: failed to refresh", exc_info=e)
+        if _stop.wait(RECOMMEND_REFRESH_SECONDS * random.uniform(0.5, 1.0)):
+            break
+
+
+def start_refresher():
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=_run, name="recommend", daemon=True)
+        _thread.start()
+
+
+def stop_refresher():
+    _stop.set()
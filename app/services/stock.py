@@ -0,0 +1,297 @@
+"""Stock reservations for checkout, done in Redis so that a hot SKU never takes a MySQL row lock.
+
+A SKU is a style (`s{style_id}`) or a good ordered without a style (`g{good_id}`). Its stock is tracked when
+the `stock` column is not NULL. Each tracked SKU has a hash `stock:sku:{sku}` with `available` (free to
+reserve) and `reserved` (held by unpaid orders), created from MySQL on first use. Three Lua scripts make
+every change atomic:
+- reserve takes all SKUs of an order at once or none of them, recording `stock:res:{order_id}` and a
+  deadline in the `stock:expiry` sorted set;
+- confirm (on payment) turns the reservation into sales, added to the `stock:sold` hash, and unconfirm
+  takes them back should the payment fail to commit;
+- release (order deleted, or deadline passed) gives the units back.
+
+The reconciler releases expired reservations and writes `stock:sold` back to MySQL's `stock` in batches,
+so MySQL stays `units on hand - sales not yet written back`. The scripts address SKU hashes named inside a
+reservation, so they need a standalone Redis rather than a cluster.
+"""
+import datetime
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from redis import Redis
+from redis.commands.core import Script
+from redis.exceptions import RedisError
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.orm import Session
+
+from app.db import engine, redis_pool
+from app.models.good import Good, GoodStyle
+from app.models.order import Order
+from app.utils.log_utils import logger
+from config import STOCK_RESERVATION_SECONDS, STOCK_RECONCILE_SECONDS
+
+ORDER_EXPIRED = 4
+EXPIRY_KEY = "stock:expiry"
+# sku -> units sold but not yet subtracted in MySQL
+SOLD_KEY = "stock:sold"
+# A batch of `SOLD_KEY` being written back.
+SOLD_FLUSHING_KEY = "stock:sold:flushing"
+# Batches written back so far, so that a SKU hash isn't seeded from MySQL across the end of a write-back.
+FLUSHES_KEY = "stock:flushes"
+_SKU_PREFIX = "stock:sku:"
+_RELEASE_BATCH = 500
+
+# KEYS: expiry, reservation, sku hashes...; ARGV: order id, deadline, then sku, count per sku hash.
+# Returns {1} when reserved, {0, i} when the i-th SKU is short, {-1, i...} when SKU hashes are missing.
+_RESERVE = """
+local missing = {}
+for i = 3, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 0 then table.insert(missing, i - 2) end
+end
+if #missing > 0 then return {-1, unpack(missing)} end
+for i = 3, #KEYS do
+    if tonumber(redis.call('HGET', KEYS[i], 'available')) < tonumber(ARGV[2 * i - 2]) then return {0, i - 2} end
+end
+for i = 3, #KEYS do
+    local sku, count = ARGV[2 * i - 3], tonumber(ARGV[2 * i - 2])
+    redis.call('HINCRBY', KEYS[i], 'available', -count)
+    redis.call('HINCRBY', KEYS[i], 'reserved', count)
+    redis.call('HINCRBY', KEYS[2], sku, count)
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+return {1}
+"""
+
+# KEYS: expiry, reservation, sold; ARGV: order id, sku hash prefix, "confirm" or "release".
+# Returns the reservation as sku, count..., empty when the order holds none (never had one, or already
+# confirmed or released).
+_SETTLE = """
+local items = redis.call('HGETALL', KEYS[2])
+if #items == 0 then return items end
+for i = 1, #items, 2 do
+    local key, count = ARGV[2] .. items[i], tonumber(items[i + 1])
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('HINCRBY', key, 'reserved', -count)
+        if ARGV[3] == 'release' then redis.call('HINCRBY', key, 'available', count) end
+    end
+    if ARGV[3] == 'confirm' then redis.call('HINCRBY', KEYS[3], items[i], count) end
+end
+redis.call('DEL', KEYS[2])
+redis.call('ZREM', KEYS[1], ARGV[1])
+return items
+"""
+
+# KEYS: expiry, reservation, sold; ARGV: order id, sku hash prefix, deadline, then sku, count per SKU.
+# Undoes a confirm. `sold` may go negative once flush_sold has taken the sales; the next flush adds them back.
+_UNCONFIRM = """
+for i = 4, #ARGV, 2 do
+    local key, count = ARGV[2] .. ARGV[i], tonumber(ARGV[i + 1])
+    if redis.call('EXISTS', key) == 1 then redis.call('HINCRBY', key, 'reserved', count) end
+    redis.call('HINCRBY', KEYS[3], ARGV[i], -count)
+    redis.call('HINCRBY', KEYS[2], ARGV[i], count)
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+"""
+
+# KEYS: sku hash, sold, sold flushing, flushes; ARGV: sku, units on hand in MySQL, "init" or "set", then for
+# "init" the flushes seen before reading MySQL. "init" leaves an existing hash alone, and returns nil without
+# seeding when a write-back finished since MySQL was read. Returns the units available.
+_SET = """
+if ARGV[3] == 'init' then
+    if redis.call('EXISTS', KEYS[1]) == 1 then return tonumber(redis.call('HGET', KEYS[1], 'available')) end
+    if (redis.call('GET', KEYS[4]) or '0') ~= ARGV[4] then return nil end
+end
+local reserved = tonumber(redis.call('HGET', KEYS[1], 'reserved') or 0)
+local sold = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or 0)
+local flushing = tonumber(redis.call('HGET', KEYS[3], ARGV[1]) or 0)
+local available = tonumber(ARGV[2]) - reserved - sold - flushing
+redis.call('HSET', KEYS[1], 'available', available, 'reserved', reserved)
+return available
+"""
+
+_scripts: Dict[str, Script] = {}
+
+
+def _call(rdb: Redis, source: str, keys: list, args: list):
+    # EVALSHA, falling back to EVAL once per Redis server.
+    if source not in _scripts:
+        _scripts[source] = rdb.register_script(source)
+    return _scripts[source](keys=keys, args=args, client=rdb)
+
+
+def sku(good_id: int, style_id: Optional[int]) -> str:
+    return f"s{style_id}" if style_id else f"g{good_id}"
+
+
+def _reservation_key(order_id: int) -> str:
+    return f"stock:res:{order_id}"
+
+
+class Basket:
+    """The tracked SKUs of an order: sku -> units ordered."""
+
+    def __init__(self):
+        self.items: Dict[str, int] = {}
+
+    def add(self, good_id: int, style_id: Optional[int], count: int, stock: Optional[int]):
+        if stock is None:
+            return
+        s = sku(good_id, style_id)
+        self.items[s] = self.items.get(s, 0) + count
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def _load_stock(skus: List[str]) -> Dict[str, Optional[int]]:
+    # In a transaction of its own: the caller's snapshot may predate the last write-back.
+    ids = {prefix: [int(s[1:]) for s in skus if s[0] == prefix] for prefix in "sg"}
+    stocks = {}
+    with Session(engine) as db:
+        for model, prefix in ((GoodStyle, "s"), (Good, "g")):
+            if ids[prefix]:
+                for id_, stock in db.execute(select(model.id, model.stock).where(model.id.in_(ids[prefix]))):
+                    stocks[f"{prefix}{id_}"] = stock
+    return stocks
+
+
+def _seed(rdb: Redis, skus: List[str]):
+    """Creates the missing SKU hashes from MySQL's current stock."""
+    for _ in range(3):
+        flushes = rdb.get(FLUSHES_KEY) or b"0"
+        stocks = _load_stock(skus)
+        # A SKU no longer tracked stays missing, and reserve reports it short.
+        skus = [s for s in skus if stocks.get(s) is not None
+                and _call(rdb, _SET, [_SKU_PREFIX + s, SOLD_KEY, SOLD_FLUSHING_KEY, FLUSHES_KEY],
+                          [s, stocks[s], "init", flushes]) is None]
+        if not skus:
+            return
+
+
+def reserve(rdb: Redis, order_id: int, basket: Basket) -> Tuple[Optional[str], datetime.datetime]:
+    """Returns `(short_sku, deadline)`, `short_sku` being None when every SKU was reserved.
+
+    Raises `RedisError`: without Redis, stock can't be checked.
+    """
+    skus = list(basket.items)
+    deadline = datetime.datetime.now() + datetime.timedelta(seconds=STOCK_RESERVATION_SECONDS)
+    args = [order_id, deadline.timestamp()]
+    for s in skus:
+        args += [s, basket.items[s]]
+    keys = [EXPIRY_KEY, _reservation_key(order_id), *[_SKU_PREFIX + s for s in skus]]
+    for _ in range(2):
+        result = _call(rdb, _RESERVE, keys, args)
+        if result[0] != -1:
+            break
+        _seed(rdb, [skus[i - 1] for i in result[1:]])
+    return (None if result[0] == 1 else skus[result[1] - 1]), deadline
+
+
+def _settle(rdb: Redis, order_id: int, action: str) -> Dict[str, int]:
+    items = _call(rdb, _SETTLE, [EXPIRY_KEY, _reservation_key(order_id), SOLD_KEY], [order_id, _SKU_PREFIX, action])
+    return {items[i].decode(): int(items[i + 1]) for i in range(0, len(items), 2)}
+
+
+def confirm(rdb: Redis, order_id: int) -> Dict[str, int]:
+    """The units confirmed per SKU, for `unconfirm`; empty when the reservation is gone, i.e. the order expired."""
+    return _settle(rdb, order_id, "confirm")
+
+
+def unconfirm(rdb: Redis, order_id: int, items: Dict[str, int], deadline: datetime.datetime):
+    """Puts back a reservation taken by `confirm`, with its deadline, when the payment didn't commit."""
+    args = [order_id, _SKU_PREFIX, deadline.timestamp()]
+    for s, count in items.items():
+        args += [s, count]
+    _call(rdb, _UNCONFIRM, [EXPIRY_KEY, _reservation_key(order_id), SOLD_KEY], args)
+
+
+def release(rdb: Redis, order_id: int) -> bool:
+    return bool(_settle(rdb, order_id, "release"))
+
+
+def release_unplaced(rdb: Redis, *order_ids: int):
+    """Releases the reservations of orders whose transaction rolled back. Left to expire when Redis fails too."""
+    for order_id in order_ids:
+        try:
+            release(rdb, order_id)
+        except RedisError as e:
+            logger.error(f"stock: failed to release stock of order {order_id}", exc_info=e)
+
+
+def set_stock(rdb: Redis, sku_: str, stock: Optional[int]) -> Optional[int]:
+    """Applies a new MySQL `stock` (already committed) to Redis; returns the units available."""
+    if stock is None:
+        rdb.delete(_SKU_PREFIX + sku_)
+        return None
+    return _call(rdb, _SET, [_SKU_PREFIX + sku_, SOLD_KEY, SOLD_FLUSHING_KEY, FLUSHES_KEY], [sku_, stock, "set"])
+
+
+def release_expired(rdb: Redis, db: Session) -> int:
+    order_ids = [int(o) for o in rdb.zrangebyscore(EXPIRY_KEY, "-inf", time.time(), start=0, num=_RELEASE_BATCH)]
+    released = [order_id for order_id in order_ids if release(rdb, order_id)]
+    if len(released) < len(order_ids):
+        # Reservations settled some other way, e.g. a lost `stock:res:` key.
+        rdb.zrem(EXPIRY_KEY, *order_ids)
+    if released:
+        db.execute(update(Order).where(Order.id.in_(released), Order.status == 0).values(status=ORDER_EXPIRED))
+        db.commit()
+    return len(released)
+
+
+def flush_sold(rdb: Redis, db: Session) -> int:
+    """Subtracts `stock:sold` from MySQL. A batch left over by a failed flush is retried first."""
+    if not rdb.exists(SOLD_FLUSHING_KEY):
+        if not rdb.exists(SOLD_KEY):
+            return 0
+        rdb.rename(SOLD_KEY, SOLD_FLUSHING_KEY)
+    sold = {key.decode(): int(count) for key, count in rdb.hgetall(SOLD_FLUSHING_KEY).items()}
+    for model, prefix in ((GoodStyle, "s"), (Good, "g")):
+        table = model.__table__
+        rows = [{"sku_id": int(s[1:]), "sold": count} for s, count in sold.items() if s[0] == prefix and count]
+        if rows:
+            # updated_at is kept: stock isn't part of any response, so caches and ETags stay valid.
+            db.execute(update(table).where(table.c.id == bindparam("sku_id"))
+                       .values(stock=table.c.stock - bindparam("sold"), updated_at=table.c.updated_at), rows)
+    db.commit()
+    # A crash right here applies the batch twice; it errs towards showing less stock, never more.
+    pipe = rdb.pipeline()
+    pipe.delete(SOLD_FLUSHING_KEY)
+    pipe.incr(FLUSHES_KEY)
+    pipe.execute()
+    return len(sold)
+
+
+def reconcile(rdb: Redis, db: Session):
+    # One worker per interval.
+    if rdb.set("stock:reconcile:lock", 1, nx=True, ex=STOCK_RECONCILE_SECONDS):
+        release_expired(rdb, db)
+        flush_sold(rdb, db)
+
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _run():
+    rdb = Redis(connection_pool=redis_pool)
+    while True:
+        try:
+            with Session(engine) as db:
+                reconcile(rdb, db)
+        except Exception as e:
+            logger.error(f"stock: failed to reconcile", exc_info=e)
+        if _stop.wait(STOCK_RECONCILE_SECONDS * random.uniform(0.5, 1.0)):
+            break
+
+
+def start_reconciler():
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=_run, name="stock", daemon=True)
+        _thread.start()
+
+
+def stop_reconciler():
+    _stop.set()
@@ -0,0 +1,147 @@
+"""Completions for `/good/suggest`, served from a Redis sorted set where every member has score 0.
+
+Members are `{normalized name}\\0{kind}\\0{id}\\0{name}`, so `ZRANGEBYLEX` over `[prefix, prefix\\xff]` returns
+the names starting with `prefix` in lexicographic order. UTF-8 never produces a 0xff byte, which makes
+`prefix\\xff` an upper bound for every extension of `prefix`.
+"""
+import random
+import threading
+from typing import List, Optional, Tuple
+
+from redis import Redis
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db import redis_pool, replica_router
+from app.models.good import Good, Tag
+from app.utils.log_utils import logger
+from config import SUGGEST_REFRESH_SECONDS
+
+INDEX_KEY = "suggest:lex"
+# "{kind}:{id}" -> the member currently indexed for it, so renames and deletes can find the old member.
+MEMBERS_KEY = "suggest:members"
+_SEP = b"\x00"
+_REBUILD_CHUNK = 10000
+_KINDS = {"good": Good, "tag": Tag}
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def _member(kind: str, id_: int, name: str) -> bytes:
+    return _SEP.join([normalize(name).encode(), kind.encode(), str(id_).encode(), name.encode()])
+
+
+def _parse(member: bytes) -> dict:
+    _, kind, id_, name = member.split(_SEP, 3)
+    return {"kind": kind.decode(), "id": int(id_), "name": name.decode()}
+
+
+def add(rdb: Redis, kind: str, id_: int, name: str):
+    add_many(rdb, kind, [(id_, name)])
+
+
+def add_many(rdb: Redis, kind: str, items: List[Tuple[int, str]]):
+    members = {f"{kind}:{id_}": _member(kind, id_, name) for id_, name in items}
+    try:
+        old = rdb.hmget(MEMBERS_KEY, list(members))
+        stale = [o for o, m in zip(old, members.values()) if o is not None and o != m]
+        pipe = rdb.pipeline()
+        if stale:
+            pipe.zrem(INDEX_KEY, *stale)
+        pipe.zadd(INDEX_KEY, {m: 0 for m in members.values()})
+        pipe.hset(MEMBERS_KEY, mapping=members)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"suggest: failed to index {len(members)} {kind}s", exc_info=e)
+
+
+def remove(rdb: Redis, kind: str, *ids: int):
+    fields = [f"{kind}:{i}" for i in ids]
+    try:
+        members = [m for m in rdb.hmget(MEMBERS_KEY, fields) if m is not None]
+        pipe = rdb.pipeline()
+        if members:
+            pipe.zrem(INDEX_KEY, *members)
+        pipe.hdel(MEMBERS_KEY, *fields)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"suggest: failed to remove {fields}", exc_info=e)
+
+
+async def suggest(rdb: aioredis.Redis, prefix: str, k: int) -> List[dict]:
+    prefix = normalize(prefix).encode()
+    if not prefix:
+        return []
+    try:
+        members = await rdb.zrangebylex(INDEX_KEY, b"[" + prefix, b"[" + prefix + b"\xff", start=0, num=k)
+    except RedisError as e:
+        logger.error(f"suggest: failed to query {prefix!r}", exc_info=e)
+        return []
+    return [_parse(m) for m in members]
+
+
+def rebuild(rdb: Redis, db: Session):
+    # Built under temporary keys and swapped in atomically. Changes made while it runs are picked up by
+    # the next rebuild at the latest.
+    tmp_index, tmp_members = f"{INDEX_KEY}:rebuild", f"{MEMBERS_KEY}:rebuild"
+    rdb.delete(tmp_index, tmp_members)
+    for kind, model in _KINDS.items():
+        last_id = 0
+        while True:
+            rows = db.execute(select(model.id, model.name).where(model.id > last_id)
+                              .order_by(model.id).limit(_REBUILD_CHUNK)).all()
+            if not rows:
+                break
+            members = {f"{kind}:{id_}": _member(kind, id_, name) for id_, name in rows}
+            pipe = rdb.pipeline(transaction=False)
+            pipe.zadd(tmp_index, {m: 0 for m in members.values()})
+            pipe.hset(tmp_members, mapping=members)
+            pipe.execute()
+            last_id = rows[-1][0]
+    pipe = rdb.pipeline()
+    if rdb.exists(tmp_index):
+        pipe.rename(tmp_index, INDEX_KEY)
+        pipe.rename(tmp_members, MEMBERS_KEY)
+    else:
+        pipe.delete(INDEX_KEY, MEMBERS_KEY)
+    pipe.execute()
+
+
+def refresh(rdb: Redis, db: Session):
+    # Incremental updates keep the index current; the periodic rebuild only repairs updates lost to
+    # Redis errors. Also rebuilds right away when the index is missing, e.g. after a Redis flush.
+    lock = rdb.set(f"{INDEX_KEY}:lock", 1, nx=True, ex=SUGGEST_REFRESH_SECONDS)
+    if lock or not rdb.exists(INDEX_KEY):
+        rebuild(rdb, db)
+
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _run():
+    rdb = Redis(connection_pool=redis_pool)
+    while True:
+        try:
+            with Session(replica_router.pick()) as db:
+                refresh(rdb, db)
+        except Exception as e:
+            logger.error(f"suggest: failed to refresh the index", exc_info=e)
+        # Polls more often than it rebuilds, so a missing index is noticed within minutes.
+        if _stop.wait(min(SUGGEST_REFRESH_SECONDS, 300) * random.uniform(0.5, 1.0)):
+            break
+
+
+def start_refresher():
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=_run, name="suggest", daemon=True)
+        _thread.start()
+
+
+def stop_refresher():
+    _stop.set()
@@ -0,0 +1,79 @@
+import time
+from typing import Optional
+
+from redis import Redis
+from redis.client import PubSub
+from redis.exceptions import RedisError
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.db import redis_pool
+from app.models.user import User
+from app.utils.cache_utils import TTLCache
+from app.utils.log_utils import logger
+from config import USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS
+
+INVALIDATE_CHANNEL = "user_cache:invalidate"
+
+_cache = TTLCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+_redis = Redis(connection_pool=redis_pool)
+_pubsub: Optional[PubSub] = None
+_listener = None
+
+
+def get_user(user_id: int) -> Optional[User]:
+    # Only column values are cached, never an instance bound to another session.
+    data = _cache.get(user_id)
+    if data is None:
+        return None
+    user = User(**data)
+    make_transient_to_detached(user)
+    return user
+
+
+def set_user(user: User):
+    data = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+    _cache.set(user.id, data)
+
+
+def invalidate_user(user_id: int):
+    _cache.pop(user_id)
+    try:
+        _redis.publish(INVALIDATE_CHANNEL, user_id)
+    except RedisError as e:
+        logger.error(f"user_cache: failed to publish invalidation for user {user_id}", exc_info=e)
+
+
+def stats() -> dict:
+    return _cache.stats()
+
+
+def _on_invalidate(message):
+    try:
+        _cache.pop(int(message["data"]))
+    except ValueError:
+        logger.warning(f"user_cache: bad invalidation message: {message}")
+
+
+def _on_listener_error(e, pubsub, thread):
+    # Invalidations may have been missed while disconnected.
+    logger.error(f"user_cache: invalidation listener error", exc_info=e)
+    _cache.clear()
+    time.sleep(1)
+
+
+def start_listener():
+    global _pubsub, _listener
+    try:
+        _pubsub = _redis.pubsub(ignore_subscribe_messages=True)
+        _pubsub.subscribe(**{INVALIDATE_CHANNEL: _on_invalidate})
+        _listener = _pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=_on_listener_error)
+    except RedisError as e:
+        logger.error(f"user_cache: failed to subscribe, relying on ttl only", exc_info=e)
+
+
+def stop_listener():
+    if _listener is not None:
+        _listener.stop()
+    if _pubsub is not None:
+        _pubsub.close()
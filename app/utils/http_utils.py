@@ -0,0 +1,68 @@
+import datetime
+import hashlib
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Tuple
+
+from fastapi import Request, Response, status
+from fastapi_pagination import Page
+from sqlalchemy import inspect
+
+from app.utils.pagination_utils import CursorPage
+
+# Clients may keep a copy but must revalidate it on every use; a 304 then saves the body.
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    # Weak: derived from versions, not from the bytes of the body.
+    return 'W/"' + hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest() + '"'
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime.datetime]) -> dict:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        # Naive datetimes in this app are local time (datetime.now).
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(datetime.timezone.utc), usegmt=True)
+    return headers
+
+
+def is_fresh(request: Request, etag: str, last_modified: Optional[datetime.datetime]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison; If-Modified-Since is ignored when If-None-Match is present.
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        # RFC 5322 "-0000": UTC, with no claim about the local zone.
+        since = since.replace(tzinfo=datetime.timezone.utc)
+    return last_modified.astimezone(datetime.timezone.utc).replace(microsecond=0) <= since
+
+
+def not_modified(request: Request, response: Response, etag: str,
+                 last_modified: Optional[datetime.datetime]) -> Optional[Response]:
+    """Sets the validators on `response`, and returns a 304 to send instead when the client's copy is current."""
+    headers = cache_headers(etag, last_modified)
+    if is_fresh(request, etag, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def page_validators(page: Page | CursorPage, *scope) -> Tuple[str, Optional[datetime.datetime]]:
+    """ETag of a listing page, from the column values of the rows it returned.
+
+    Built after paginating, so that a page still costs what the pagination costs; a 304 saves the body only.
+    Values rather than `updated_at`, which has whole seconds only and so misses a second edit within the same
+    second. No Last-Modified: the latest `updated_at` of a page misses rows dropped from it. `scope` goes into
+    the ETag for anything else the page depends on, e.g. the user it is filtered for.
+    """
+    rows = [tuple(getattr(item, attr.key) for attr in inspect(item).mapper.column_attrs) for item in page.items]
+    bounds = page.total if isinstance(page, Page) else page.next_cursor
+    return make_etag("page", rows, bounds, *scope), None
@@ -0,0 +1,77 @@
+import base64
+import datetime
+import json
+from typing import Generic, List, Optional, Sequence, TypeVar
+
+from fastapi import HTTPException, status
+from fastapi_pagination import Page, Params
+from fastapi_pagination.ext.sqlalchemy import paginate
+from pydantic import BaseModel
+from sqlalchemy import Select, and_, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+
+T = TypeVar("T")
+
+CURSOR_DESCRIPTION = "`cursor` 为空字符串时进入游标分页模式，不计算总数。"
+
+
+class CursorPage(BaseModel, Generic[T]):
+    items: List[T]
+    size: int
+    # Required, so that FastAPI's attribute-based validation of a `Page | CursorPage` response
+    # can't read a Page as a CursorPage.
+    next_cursor: Optional[str]
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime.datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Sequence[ColumnElement]) -> list:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if len(raw) != len(keys):
+            raise ValueError(f"expected {len(keys)} values")
+        return [datetime.datetime.fromisoformat(v) if k.type.python_type is datetime.datetime else k.type.python_type(v)
+                for k, v in zip(keys, raw)]
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid cursor: {e}")
+
+
+def _seek_condition(keys: Sequence[ColumnElement], values: list, descending: bool):
+    # (k1, k2, ...) < (v1, v2, ...) expanded, so that MySQL can use an index on the leading key.
+    key, value = keys[0], values[0]
+    after = key < value if descending else key > value
+    if len(keys) == 1:
+        return after
+    return or_(after, and_(key == value, _seek_condition(keys[1:], values[1:], descending)))
+
+
+def seek_paginate(db: Session, query: Select, keys: Sequence[ColumnElement], cursor: Optional[str], size: int,
+                  descending: bool = True) -> CursorPage:
+    """Keyset pagination over `keys`, which must end with a unique column (usually the primary key).
+
+    `query` must select a single entity; no total is counted, so every page costs O(size) regardless of depth.
+    """
+    if cursor:
+        query = query.where(_seek_condition(keys, decode_cursor(cursor, keys), descending))
+    query = (query.add_columns(*keys)
+             .order_by(None)
+             .order_by(*[k.desc() if descending else k.asc() for k in keys])
+             .limit(size + 1))
+    rows = db.execute(query).all()
+    next_cursor = encode_cursor(rows[size - 1][1:]) if len(rows) > size else None
+    return CursorPage(items=[row[0] for row in rows[:size]], size=size, next_cursor=next_cursor)
+
+
+def paginate_or_seek(db: Session, query: Select, keys: Sequence[ColumnElement], cursor: Optional[str], params: Params,
+                     descending: bool = True) -> Page | CursorPage:
+    """`paginate` as before, or `seek_paginate` on `keys` once the client passes `cursor` (empty for the first page).
+
+    `keys` should follow the order `query` already uses in page mode, so that both modes list the same sequence.
+    """
+    if cursor is None:
+        return paginate(db, query, params)
+    return seek_paginate(db, query, keys, cursor, params.size, descending)
@@ -0,0 +1,93 @@
+import time
+from typing import Dict, Type
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from .log_utils import logger
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float):
+        self.waits += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+
+_metrics: Dict[str, PoolMetrics] = {}
+_engines: Dict[str, Engine] = {}
+
+
+def timed_pool_class(base: Type[QueuePool], name: str) -> Type[QueuePool]:
+    """Subclass `base` so that `connect()` records how long callers wait for a connection.
+
+    Pool events fire only once a connection has been handed out, so the wait itself has to be timed here.
+    The class is re-used by `Pool.recreate()`, so metrics survive `engine.dispose()`.
+    """
+    metrics = _metrics.setdefault(name, PoolMetrics())
+
+    class TimedPool(base):
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                return super().connect()
+            except exc.TimeoutError:
+                metrics.timeouts += 1
+                logger.error(f"pool {name}: checkout timed out, size={self.size()} overflow={self.overflow()}")
+                raise
+            finally:
+                metrics.record_wait(time.perf_counter() - start)
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
+
+
+def instrument_engine(engine: Engine, name: str):
+    metrics = _metrics.setdefault(name, PoolMetrics())
+    _engines[name] = engine
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.connects += 1
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.checkouts += 1
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        metrics.checkins += 1
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.invalidations += 1
+
+
+def pool_stats() -> Dict[str, dict]:
+    stats = {}
+    for name, engine in _engines.items():
+        pool, metrics = engine.pool, _metrics[name]
+        stats[name] = {
+            "size": pool.size() if isinstance(pool, QueuePool) else None,
+            "checked_out": pool.checkedout() if isinstance(pool, QueuePool) else None,
+            "overflow": max(pool.overflow(), 0) if isinstance(pool, QueuePool) else None,
+            "checkouts": metrics.checkouts,
+            "checkins": metrics.checkins,
+            "connects": metrics.connects,
+            "invalidations": metrics.invalidations,
+            "timeouts": metrics.timeouts,
+            "wait_seconds_avg": metrics.wait_seconds_total / metrics.waits if metrics.waits else 0.0,
+            "wait_seconds_max": metrics.wait_seconds_max,
+        }
+    return stats
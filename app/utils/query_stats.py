@@ -0,0 +1,94 @@
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from . import slow_query
+from .log_utils import logger
+from config import N_PLUS_ONE_THRESHOLD
+
+
+class RequestQueryStats:
+    def __init__(self, route: str):
+        self.route = route
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: Counter[str] = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.seconds * 1000:.2f};desc="{self.count} queries"'
+
+    def check_n_plus_one(self):
+        for statement, count in self.statements.most_common():
+            if count < N_PLUS_ONE_THRESHOLD:
+                break
+            logger.warning(f"query_stats: possible N+1 in {self.route}: "
+                           f"{count} identical statements: {' '.join(statement.split())[:300]}")
+
+
+_current: ContextVar[Optional[RequestQueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[RequestQueryStats]:
+    return _current.get()
+
+
+def instrument_queries(engine: Engine, explain_engine: Optional[Engine] = None):
+    # `explain_engine` must be a sync engine; the async engine's `sync_engine` can't be used outside a greenlet.
+    explain_engine = explain_engine or engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append((statement, time.perf_counter()))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()[1]
+        stats = _current.get()
+        if stats is not None:
+            stats.record(statement, elapsed)
+        slow_query.record(explain_engine, statement, parameters, executemany, elapsed,
+                          stats.route if stats is not None else "-")
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        # A failed statement never reaches after_cursor_execute; drop its start so that the pooled
+        # connection's later timings stay paired. Errors raised elsewhere (e.g. fetching) find it popped.
+        starts = ctx.connection.info.get("query_start") if ctx.connection is not None else None
+        if starts and starts[-1][0] is ctx.statement:
+            starts.pop()
+
+
+class QueryStatsMiddleware:
+    """Counts the SQL statements issued while handling each request and reports them in `Server-Timing`."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestQueryStats(f"{scope['method']} {scope['path']}")
+        token = _current.set(stats)
+
+        async def send_with_timing(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            stats.check_n_plus_one()
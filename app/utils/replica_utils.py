@@ -0,0 +1,85 @@
+import itertools
+import threading
+from typing import List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from .log_utils import logger
+
+
+class ReplicaRouter:
+    """Round-robins reads over the healthy replicas, falling back to the primary when none is usable.
+
+    A replica is taken out of rotation when a connection to it fails or when the periodic check finds
+    replication stopped or lagging more than `max_lag` seconds behind the source.
+    """
+
+    def __init__(self, primary: Engine, replicas: List[Engine], max_lag: float, check_interval: float):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        # Replicas join the rotation only after passing their first check.
+        self._healthy = {id(r): False for r in replicas}
+        self._counter = itertools.count()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        for replica in replicas:
+            event.listen(replica, "handle_error", self._on_error)
+
+    def pick(self) -> Engine:
+        healthy = [r for r in self.replicas if self._healthy[id(r)]]
+        if not healthy:
+            return self.primary
+        return healthy[next(self._counter) % len(healthy)]
+
+    def _set_healthy(self, replica: Engine, healthy: bool, reason: str = ""):
+        if self._healthy[id(replica)] != healthy:
+            if healthy:
+                logger.warning(f"replica {replica.url.host}: back in rotation")
+            else:
+                logger.warning(f"replica {replica.url.host}: out of rotation: {reason}")
+        self._healthy[id(replica)] = healthy
+
+    def _on_error(self, context):
+        if context.is_disconnect and context.engine is not None:
+            self._set_healthy(context.engine, False, "connection lost")
+
+    def _lag(self, replica: Engine) -> Optional[float]:
+        with replica.connect() as conn:
+            status = conn.execute(text("SHOW REPLICA STATUS")).mappings().first()
+        if status is None:
+            return None
+        return status.get("Seconds_Behind_Source")
+
+    def check(self):
+        for replica in self.replicas:
+            try:
+                lag = self._lag(replica)
+            except Exception as e:
+                self._set_healthy(replica, False, f"check failed: {e}")
+                continue
+            if lag is None:
+                self._set_healthy(replica, False, "replication is not running")
+            elif lag > self.max_lag:
+                self._set_healthy(replica, False, f"lagging {lag}s behind")
+            else:
+                self._set_healthy(replica, True)
+
+    def _run(self):
+        self.check()
+        while not self._stop.wait(self.check_interval):
+            self.check()
+
+    def start(self):
+        if not self.replicas or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="replica-check", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> List[dict]:
+        return [{"host": r.url.host, "healthy": self._healthy[id(r)]} for r in self.replicas]
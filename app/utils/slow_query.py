@@ -0,0 +1,54 @@
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy.engine import Engine
+
+from .log_utils import LOG_STORAGE_PATH, fmt
+from config import SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN
+
+slow_query_logger = logging.getLogger("slow_query")
+slow_query_logger.setLevel(logging.INFO)
+slow_query_logger.propagate = False
+_handler = logging.FileHandler(LOG_STORAGE_PATH / f"slow-query-{datetime.now().strftime('%Y%m%d-%H%M%S')}.log")
+_handler.setFormatter(fmt)
+slow_query_logger.addHandler(_handler)
+
+# EXPLAIN runs on a single background thread, off the request path; excess plans are dropped rather than queued.
+_explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+_explain_pending = 0
+_explain_lock = threading.Lock()
+_MAX_EXPLAIN_PENDING = 100
+_ids = itertools.count(1)
+
+
+def _explain(query_id: int, engine: Engine, statement: str, parameters):
+    global _explain_pending
+    try:
+        with engine.connect() as conn:
+            result = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+            plan = [dict(row) for row in result.mappings()]
+        slow_query_logger.info(f"#{query_id} explain: {plan}")
+    except Exception as e:
+        slow_query_logger.warning(f"#{query_id} explain failed: {e}")
+    finally:
+        with _explain_lock:
+            _explain_pending -= 1
+
+
+def record(engine: Engine, statement: str, parameters, executemany: bool, seconds: float, route: str):
+    global _explain_pending
+    if seconds * 1000 < SLOW_QUERY_MS or statement.lstrip()[:7].upper() == "EXPLAIN":
+        return
+    query_id = next(_ids)
+    params = "<executemany>" if executemany else repr(parameters)[:1000]
+    slow_query_logger.info(f"#{query_id} {seconds * 1000:.1f}ms | {route} | {' '.join(statement.split())} | "
+                           f"params={params}")
+    if SLOW_QUERY_EXPLAIN and not executemany and statement.lstrip()[:6].upper() == "SELECT":
+        with _explain_lock:
+            if _explain_pending >= _MAX_EXPLAIN_PENDING:
+                return
+            _explain_pending += 1
+        _explain_executor.submit(_explain, query_id, engine, statement, parameters)
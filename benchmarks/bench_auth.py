@@ -0,0 +1,37 @@
+"""Compare cached and uncached JWT verification overhead of the auth dependency.
+
+Run from the project root (a `config.yaml` is required): python -m benchmarks.bench_auth
+"""
+import argparse
+import timeit
+from datetime import timedelta
+
+from jose import jwt
+
+from app.auth import create_access_token, decode_user_id, _token_cache
+from config import SECRET_KEY, ALGORITHM
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = create_access_token({"sub": "bench", "id": 1}, expires_delta=timedelta(minutes=5))
+
+    def uncached():
+        _token_cache.clear()
+        decode_user_id(token)
+
+    results = {
+        "jwt.decode": timeit.timeit(lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]),
+                                    number=args.number),
+        "decode_user_id (uncached)": timeit.timeit(uncached, number=args.number),
+        "decode_user_id (cached)": timeit.timeit(lambda: decode_user_id(token), number=args.number),
+    }
+    for name, seconds in results.items():
+        print(f"{name:<28} {seconds / args.number * 1e6:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
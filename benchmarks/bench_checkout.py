@@ -0,0 +1,90 @@
+"""Measure SQL statements and latency per checkout as the basket grows.
+
+Seeds synthetic goods, half of them with a style, into an existing store and places orders for the user
+owning `--address-id`, synchronously even with `order_intake.enabled`. The seeded goods, orders, order items
+and their leaderboard counts are deleted afterwards. Run from the project root against a migrated MySQL
+database: python -m benchmarks.bench_checkout --store-id 1 --address-id 1
+"""
+import argparse
+import datetime
+import time
+
+from redis import Redis
+from sqlalchemy import select, insert, delete
+from sqlalchemy.orm import Session
+
+from app.db import engine, redis_pool
+from app.models.good import Good, GoodStyle
+from app.models.order import Order, OrderItem
+from app.models.user import Address, User
+from app.routers.order import _place_order
+from app.schemas.order import OrderFullCreate, OrderItemFullCreate
+from app.services import leaderboard
+from app.utils import query_stats
+
+BENCH_MARK = "[bench_checkout]"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store-id", type=int, required=True)
+    parser.add_argument("--address-id", type=int, required=True)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("-n", "--number", type=int, default=20)
+    args = parser.parse_args()
+
+    rdb = Redis(connection_pool=redis_pool)
+    order_ids, good_ids = [], []
+    started = datetime.datetime.now()
+    try:
+        with Session(engine) as db:
+            address = db.get(Address, args.address_id)
+            user = db.get(User, address.user_id)
+            db.execute(insert(Good), [{"store_id": args.store_id, "name": f"bench {i}", "description": BENCH_MARK,
+                                       "price": 100 + i} for i in range(max(args.sizes))])
+            good_ids = db.execute(select(Good.id).where(Good.store_id == args.store_id,
+                                                        Good.description == BENCH_MARK)
+                                  .order_by(Good.id)).scalars().all()
+            db.execute(insert(GoodStyle), [{"good_id": good_id, "name": "bench", "price": 200}
+                                           for good_id in good_ids[::2]])
+            style_ids = dict(db.execute(select(GoodStyle.good_id, GoodStyle.id)
+                                        .where(GoodStyle.good_id.in_(good_ids))).tuples().all())
+            db.commit()
+
+            for size in args.sizes:
+                order_dict = OrderFullCreate(address_id=address.id, goods=[
+                    OrderItemFullCreate(good_id=good_id, style_id=style_ids.get(good_id), count=1)
+                    for good_id in good_ids[:size]])
+                statements, seconds = 0, 0.0
+                for _ in range(args.number):
+                    stats = query_stats.RequestQueryStats("bench_checkout")
+                    token = query_stats._current.set(stats)
+                    start = time.perf_counter()
+                    order_ids.append(_place_order(order_dict, user, db, rdb).id)
+                    seconds += time.perf_counter() - start
+                    query_stats._current.reset(token)
+                    statements += stats.count
+                print(f"{size:>5} lines  {statements / args.number:6.1f} statements  "
+                      f"{seconds / args.number * 1e3:8.2f} ms/checkout")
+    finally:
+        with Session(engine) as db:
+            for i in range(0, len(order_ids), 1000):
+                chunk = order_ids[i:i + 1000]
+                db.execute(delete(OrderItem).where(OrderItem.order_id.in_(chunk)))
+                db.execute(delete(Order).where(Order.id.in_(chunk)))
+            bench_goods = select(Good.id).where(Good.store_id == args.store_id, Good.description == BENCH_MARK)
+            db.execute(delete(GoodStyle).where(GoodStyle.good_id.in_(bench_goods.scalar_subquery())))
+            db.execute(delete(Good).where(Good.store_id == args.store_id, Good.description == BENCH_MARK))
+            db.commit()
+        if good_ids:
+            # The all-time boards never expire.
+            pipe = rdb.pipeline(transaction=False)
+            for window in ("day", "week", "all"):
+                for scope in ("all", f"store:{args.store_id}"):
+                    for when in (started, datetime.datetime.now()):
+                        pipe.zrem(leaderboard.key("ordered", scope, window, when), *good_ids)
+            pipe.execute()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Compare `LIKE '%q%'` and FULLTEXT ngram search latency as the catalogue grows.
+
+Seeds synthetic goods into an existing store, times both queries at each catalogue size and deletes
+the seeded rows afterwards. Both return the same page: the 50 matches with the highest id, as `/good/search` does
+without `sort` or `q`; LIKE can't rank by relevance. Run from the project root against a migrated MySQL database:
+python -m benchmarks.bench_search --store-id 1
+"""
+import argparse
+import random
+import timeit
+
+from sqlalchemy import select, insert, delete, or_
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.orm import Session
+
+from app.db import engine
+from app.models.good import Good
+
+WORDS = ["手机", "耳机", "充电器", "数据线", "键盘", "鼠标", "显示器", "笔记本", "背包", "水杯",
+         "台灯", "雨伞", "衬衫", "外套", "运动鞋", "帽子", "手表", "音箱", "相机", "平板"]
+BENCH_MARK = "[bench_search]"
+
+
+def _random_text(n: int) -> str:
+    return "".join(random.choices(WORDS, k=n))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store-id", type=int, required=True)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("-q", "--query", default="耳机")
+    parser.add_argument("-n", "--number", type=int, default=20)
+    args = parser.parse_args()
+
+    q = args.query
+    conditions = {
+        "like": or_(Good.name.like(f"%{q}%"), Good.description.like(f"%{q}%")),
+        "fulltext": match(Good.name, Good.description, against=f'"{q}"').in_boolean_mode(),
+    }
+    queries = {name: select(Good.id).where(condition).order_by(Good.id.desc()).limit(50)
+               for name, condition in conditions.items()}
+
+    seeded = 0
+    try:
+        with Session(engine) as db:
+            for size in sorted(args.sizes):
+                rows = [{"store_id": args.store_id, "name": _random_text(3),
+                         "description": f"{BENCH_MARK} {_random_text(12)}", "price": random.randint(1, 10000)}
+                        for _ in range(size - seeded)]
+                for i in range(0, len(rows), 5000):
+                    db.execute(insert(Good), rows[i:i + 5000])
+                db.commit()
+                seeded = size
+                for name, query in queries.items():
+                    seconds = timeit.timeit(lambda: db.execute(query).all(), number=args.number)
+                    print(f"{size:>8} goods  {name:<9} {seconds / args.number * 1e3:8.2f} ms/query")
+    finally:
+        with Session(engine) as db:
+            db.execute(delete(Good).where(Good.store_id == args.store_id,
+                                          Good.description.startswith(BENCH_MARK)))
+            db.commit()
+
+
+if __name__ == "__main__":
+    main()
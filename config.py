@@ -6,17 +6,59 @@ with open("config.yaml") as config:
     password = cfg["database"]["password"]
     db_name = cfg["database"]["db_name"]
     host = cfg["database"]["host"]
+    DB_POOL_SIZE = cfg["database"].get("pool_size", 5)
+    DB_MAX_OVERFLOW = cfg["database"].get("max_overflow", 10)
+    DB_POOL_TIMEOUT = cfg["database"].get("pool_timeout", 30)
+    DB_POOL_RECYCLE = cfg["database"].get("pool_recycle", 3600)
+    DB_POOL_PRE_PING = cfg["database"].get("pool_pre_ping", True)
+    DB_REPLICAS = cfg["database"].get("replicas", [])
+    DB_REPLICA_MAX_LAG = cfg["database"].get("replica_max_lag", 5)
+    DB_REPLICA_CHECK_INTERVAL = cfg["database"].get("replica_check_interval", 10)
     SECRET_KEY = cfg["auth"]["secret_key"]
     ALGORITHM = cfg["auth"]["algorithm"]
     ACCESS_TOKEN_EXPIRE_MINUTES = cfg["auth"]["access_token_expire_minutes"]
+    TOKEN_CACHE_MAX_SIZE = cfg["auth"].get("token_cache_max_size", 10000)
     STORAGE_PATH = cfg["storage"]["storage_path"]
     FILE_BLOCK_SIZE = cfg["storage"]["file_block_size"]
     LOG_STORAGE_PATH = cfg["storage"]["log_storage_path"]
+    N_PLUS_ONE_THRESHOLD = cfg.get("query_stats", {}).get("n_plus_one_threshold", 5)
+    SLOW_QUERY_MS = cfg.get("query_stats", {}).get("slow_query_ms", 200)
+    SLOW_QUERY_EXPLAIN = cfg.get("query_stats", {}).get("slow_query_explain", True)
     api_root = cfg["api_root"]
     enable_doc = cfg["enable_doc"]
     allow_origins = cfg["allow_origins"]
     redis_host = cfg["redis"]["host"]
     redis_port = cfg["redis"]["port"]
+    redis_max_connections = cfg["redis"].get("max_connections", 64)
+    redis_socket_timeout = cfg["redis"].get("socket_timeout", 5)
+    redis_socket_connect_timeout = cfg["redis"].get("socket_connect_timeout", 2)
+    redis_health_check_interval = cfg["redis"].get("health_check_interval", 30)
+    # user cache
+    USER_CACHE_MAX_SIZE = cfg.get("user_cache", {}).get("max_size", 10000)
+    USER_CACHE_TTL_SECONDS = cfg.get("user_cache", {}).get("ttl_seconds", 60)
+    # random goods/tags on the home page
+    RANDOM_POOL_REFRESH_SECONDS = cfg.get("random_pool", {}).get("refresh_seconds", 300)
+    # serialized GET /good/{good_id} responses
+    GOOD_CACHE_TTL_SECONDS = cfg.get("good_cache", {}).get("ttl_seconds", 3600)
+    # search-as-you-type completions
+    SUGGEST_REFRESH_SECONDS = cfg.get("suggest", {}).get("refresh_seconds", 3600)
+    # "customers also bought"
+    RECOMMEND_REFRESH_SECONDS = cfg.get("recommend", {}).get("refresh_seconds", 600)
+    RECOMMEND_REBUILD_SECONDS = cfg.get("recommend", {}).get("rebuild_seconds", 86400)
+    RECOMMEND_TOP_K = cfg.get("recommend", {}).get("top_k", 20)
+    RECOMMEND_MAX_PAIRS = cfg.get("recommend", {}).get("max_pairs", 5000000)
+    # stock reservations
+    STOCK_RESERVATION_SECONDS = cfg.get("stock", {}).get("reservation_seconds", 900)
+    STOCK_RECONCILE_SECONDS = cfg.get("stock", {}).get("reconcile_seconds", 5)
+    # queued order placement
+    ORDER_INTAKE_ENABLED = cfg.get("order_intake", {}).get("enabled", False)
+    ORDER_INTAKE_CONSUMERS = cfg.get("order_intake", {}).get("consumers", 1)
+    ORDER_INTAKE_BATCH_SIZE = cfg.get("order_intake", {}).get("batch_size", 100)
+    ORDER_INTAKE_BLOCK_MS = cfg.get("order_intake", {}).get("block_ms", 100)
+    ORDER_INTAKE_TICKET_TTL_SECONDS = cfg.get("order_intake", {}).get("ticket_ttl_seconds", 3600)
+    # password hashing
+    PASSWORD_HASH_WORKERS = cfg.get("password_hash", {}).get("workers", 2)
+    PASSWORD_HASH_MAX_PENDING = cfg.get("password_hash", {}).get("max_pending", 64)
     # mail
     smtp_server = cfg["mail"]["smtp_server"]
     smtp_port = cfg["mail"]["smtp_port"]
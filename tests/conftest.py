@@ -0,0 +1,48 @@
+import fakeredis
+import pytest
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.orm import Session
+
+from app.models.base import Base
+from app.models.good import Good, GoodStyle
+from app.models.store import Store
+from app.models.user import Address, User
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def rdb(redis_server):
+    return fakeredis.FakeRedis(server=redis_server)
+
+
+@pytest.fixture
+def database(tmp_path):
+    """The whole schema on a SQLite file that enforces foreign keys, with a user, store, address and a good with
+    one style (all id 1). A file, not memory, so that sessions get connections of their own as with MySQL."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'shop.db'}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", lambda conn, _: conn.execute("PRAGMA foreign_keys=ON"))
+    # SQLite can't autoincrement a composite primary key.
+    Base.metadata.create_all(engine, tables=[t for t in Base.metadata.sorted_tables if t.name != "tag_good_link"])
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE tag_good_link (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                          "tag_id INT NOT NULL REFERENCES tag (id), good_id INT NOT NULL REFERENCES good (id), "
+                          "created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL)"))
+        conn.execute(insert(User), [{"id": 1, "username": "u", "hashed_password": "-"}])
+        conn.execute(insert(Store), [{"id": 1, "owner_id": 1, "name": "s", "description": "d"}])
+        conn.execute(insert(Address), [{"id": 1, "user_id": 1, "name": "n", "phone_number": "1", "detail": "d"}])
+        conn.execute(insert(Good), [{"id": 1, "store_id": 1, "name": "g", "description": "d", "price": 10,
+                                     "stock": None}])
+        conn.execute(insert(GoodStyle), [{"id": 1, "good_id": 1, "name": "s", "price": 20, "stock": None}])
+    return engine
+
+
+@pytest.fixture
+def user(database) -> User:
+    with Session(database) as db:
+        user = db.get(User, 1)
+        db.expunge(user)
+    return user
@@ -0,0 +1,61 @@
+import io
+import json
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+
+from app.models.good import Good, GoodDetail, GoodStyle
+from app.models.order import CartItem
+from app.routers.good import get_full_good, update_full_good
+from app.schemas.good import GoodFullUpdate, GoodStyleFullUpdate
+from app.services import good_cache
+from app.services.good_import import GoodImporter, jsonl_records
+
+
+def test_update_full_good_keeps_referenced_style(database, rdb, user):
+    with database.begin() as conn:
+        conn.execute(insert(CartItem), [{"user_id": 1, "good_id": 1, "style_id": 1, "count": 1}])
+    with Session(database) as db:
+        with pytest.raises(HTTPException) as e:
+            update_full_good(1, GoodFullUpdate(name="renamed", styles=[GoodStyleFullUpdate(name="new", price=1)]),
+                             user, db, rdb)
+        assert e.value.status_code == 400
+        assert not db.dirty and not db.new
+    with Session(database) as db:
+        assert db.execute(select(GoodStyle.id, GoodStyle.name)).all() == [(1, "s")]
+
+
+def test_update_full_good_replaces_unreferenced_style(database, rdb, user):
+    with Session(database) as db:
+        good = update_full_good(1, GoodFullUpdate(styles=[GoodStyleFullUpdate(name="new", price=1)]), user, db, rdb)
+    assert [(style.name, style.price) for style in good.styles] == [("new", 1)]
+
+
+def test_full_good_etag_follows_cache_generation(database, rdb):
+    request = Request({"type": "http", "headers": []})
+    with Session(database) as db:
+        etag = get_full_good(1, request, db, rdb).headers["etag"]
+        assert get_full_good(1, request, db, rdb).headers["etag"] == etag
+        # A write within the same second leaves updated_at alone, but bumps the generation.
+        good_cache.invalidate(rdb, 1)
+        assert get_full_good(1, request, db, rdb).headers["etag"] != etag
+
+
+def test_import_links_children_to_their_goods(database, rdb, user):
+    records = [{"store_id": 1, "name": f"g{i}", "description": "d", "price": i, "details": [{"text": f"d{i}"}],
+                "styles": [{"name": f"s{i}", "price": i}]} for i in range(3)]
+    records.insert(1, {"store_id": 9, "name": "x", "description": "d", "price": 1, "details": [], "styles": []})
+    f = io.BytesIO("".join(json.dumps(record) + "\n" for record in records).encode())
+    with Session(database) as db:
+        result = GoodImporter(db, rdb, user).run(jsonl_records(f))
+        assert (result.imported, result.failed) == (3, 1)
+        goods = dict(db.execute(select(Good.id, Good.name).where(Good.id > 1)).tuples().all())
+        assert sorted(goods.values()) == ["g0", "g1", "g2"]
+        assert sorted((goods[good_id], text) for good_id, text in db.execute(
+            select(GoodDetail.good_id, GoodDetail.text))) == [("g0", "d0"), ("g1", "d1"), ("g2", "d2")]
+        assert sorted((goods[good_id], name) for good_id, name in db.execute(
+            select(GoodStyle.good_id, GoodStyle.name).where(GoodStyle.id > 1))) == [("g0", "s0"), ("g1", "s1"),
+                                                                                    ("g2", "s2")]
@@ -0,0 +1,41 @@
+import datetime
+
+from starlette.requests import Request
+
+from app.models.good import Good
+from app.utils.http_utils import is_fresh, make_etag, page_validators
+from app.utils.pagination_utils import CursorPage
+
+LAST_MODIFIED = datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+ETAG = make_etag("good", 1)
+
+
+def _request(**headers) -> Request:
+    return Request({"type": "http", "headers": [(k.replace("_", "-").encode(), v.encode())
+                                                for k, v in headers.items()]})
+
+
+def test_if_none_match():
+    assert is_fresh(_request(if_none_match=ETAG), ETAG, LAST_MODIFIED)
+    assert is_fresh(_request(if_none_match=ETAG.removeprefix("W/")), ETAG, LAST_MODIFIED)
+    assert not is_fresh(_request(if_none_match=make_etag("good", 2)), ETAG, LAST_MODIFIED)
+
+
+def test_if_modified_since():
+    assert is_fresh(_request(if_modified_since="Tue, 02 Jan 2024 03:04:05 GMT"), ETAG, LAST_MODIFIED)
+    assert not is_fresh(_request(if_modified_since="Tue, 02 Jan 2024 03:04:04 GMT"), ETAG, LAST_MODIFIED)
+    assert not is_fresh(_request(if_modified_since="yesterday"), ETAG, LAST_MODIFIED)
+
+
+def test_if_modified_since_without_zone():
+    # parsedate_to_datetime returns a naive datetime for "-0000".
+    assert is_fresh(_request(if_modified_since="Tue, 02 Jan 2024 03:04:05 -0000"), ETAG, LAST_MODIFIED)
+    assert not is_fresh(_request(if_modified_since="Tue, 02 Jan 2024 03:04:04 -0000"), ETAG, LAST_MODIFIED)
+
+
+def test_page_etag_sees_edits_within_a_second():
+    updated_at = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    page = CursorPage(items=[Good(id=1, name="a", price=1, updated_at=updated_at)], size=1, next_cursor=None)
+    edited = CursorPage(items=[Good(id=1, name="b", price=1, updated_at=updated_at)], size=1, next_cursor=None)
+    assert page_validators(page)[0] != page_validators(edited)[0]
+    assert page_validators(page)[0] == page_validators(page)[0]
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+
+import fakeredis
+import pytest
+from redis import asyncio as aioredis
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.models.good import Good
+from app.models.order import Order, OrderItem
+from app.schemas.order import OrderFullCreate, OrderItemFullCreate
+from app.services import order_intake, stock
+
+
+@pytest.fixture
+def intake(database, redis_server, monkeypatch):
+    with database.begin() as conn:
+        conn.execute(update(Good).where(Good.id == 1).values(stock=1))
+    monkeypatch.setattr(stock, "engine", database)
+    monkeypatch.setattr(order_intake, "async_redis_pool",
+                        aioredis.ConnectionPool(connection_class=fakeredis.aioredis.FakeConnection,
+                                                server=redis_server))
+
+
+def _order(good_id: int = 1, address_id: int = 1) -> OrderFullCreate:
+    return OrderFullCreate(address_id=address_id, goods=[OrderItemFullCreate(good_id=good_id, count=1)])
+
+
+def _process_batch(rdb, database):
+    order_intake._ensure_group(rdb)
+    entries = rdb.xreadgroup(order_intake.GROUP, "test", {order_intake.STREAM_KEY: ">"}, count=100)[0][1]
+    with Session(database) as db:
+        order_intake.process(rdb, db, entries)
+
+
+def _ticket(rdb, ticket: str, wait: float = 0):
+    async def get():
+        async with aioredis.Redis(connection_pool=order_intake.async_redis_pool) as ardb:
+            try:
+                return await order_intake.get_ticket(ardb, ticket, wait)
+            finally:
+                await order_intake.stop_listener()
+    return asyncio.run(get())
+
+
+def test_batch_resolves_tickets(database, rdb, user, intake):
+    placed = order_intake.submit(rdb, user, _order())
+    short = order_intake.submit(rdb, user, _order())
+    no_address = order_intake.submit(rdb, user, _order(address_id=9))
+    no_good = order_intake.submit(rdb, user, _order(good_id=9))
+    assert placed.status == "pending"
+    assert _ticket(rdb, placed.ticket)[1].status == "pending"
+
+    _process_batch(rdb, database)
+
+    user_id, read = _ticket(rdb, placed.ticket)
+    assert (user_id, read.status) == (user.id, "created")
+    assert [_ticket(rdb, t.ticket)[1].detail for t in (short, no_address, no_good)] == \
+        ["Out of stock.", "Address not found.", "Good not found."]
+    with Session(database) as db:
+        assert db.execute(select(Order.id)).scalars().all() == [read.order_id]
+        assert db.execute(select(OrderItem.order_id, OrderItem.good_id)).all() == [(read.order_id, 1)]
+    assert rdb.xlen(order_intake.STREAM_KEY) == 0
+    assert rdb.xpending(order_intake.STREAM_KEY, order_intake.GROUP)["pending"] == 0
+    assert _ticket(rdb, "unknown") is None
+
+
+def test_long_poll_wakes_on_result(database, rdb, user, intake):
+    ticket = order_intake.submit(rdb, user, _order())
+    timer = threading.Timer(0.3, _process_batch, (rdb, database))
+    timer.start()
+    try:
+        _, read = _ticket(rdb, ticket.ticket, wait=10)
+    finally:
+        timer.join()
+    assert read.status == "created"
@@ -0,0 +1,31 @@
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models.good import Good
+from app.models.order import Order, OrderItem
+from app.services.recommend import CoPurchaseModel
+
+
+def _place(conn, order_id: int, *good_ids: int):
+    conn.execute(insert(Order), [{"id": order_id, "user_id": 1, "address_id": 1, "total_price": 1}])
+    conn.execute(insert(OrderItem), [{"order_id": order_id, "good_id": good_id, "count": 1, "price": 1}
+                                     for good_id in good_ids])
+
+
+def test_update_counts_late_orders_once(database):
+    with database.begin() as conn:
+        conn.execute(insert(Good), [{"id": i, "store_id": 1, "name": "g", "description": "d", "price": 1,
+                                     "stock": None} for i in (2, 3)])
+        _place(conn, 10, 1, 2)
+        _place(conn, 12, 1, 2)
+    model = CoPurchaseModel()
+    with Session(database) as db:
+        assert model.update(db) == 2
+    # Committed after order 12 was read.
+    with database.begin() as conn:
+        _place(conn, 11, 1, 3)
+    with Session(database) as db:
+        assert model.update(db) == 1
+        assert model.update(db) == 0
+    assert model.counts[1, 1] == 3 and model.counts[1, 2] == 2 and model.counts[1, 3] == 1
+    assert model.get(2, 10) == [1] and model.get(3, 10) == [1]
@@ -0,0 +1,120 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.models.good import Good, GoodStyle
+from app.models.order import Order
+from app.services import stock
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Good.metadata.create_all(engine, tables=[Good.__table__, GoodStyle.__table__, Order.__table__])
+    with engine.begin() as conn:
+        conn.execute(insert(Good), [{"id": 1, "store_id": 1, "name": "g", "description": "d", "price": 10, "stock": 5},
+                                    {"id": 2, "store_id": 1, "name": "g", "description": "d", "price": 10, "stock": None}])
+        conn.execute(insert(GoodStyle), [{"id": 1, "good_id": 2, "name": "s", "price": 20, "stock": 3}])
+        conn.execute(insert(Order), [{"id": i, "user_id": 1, "address_id": 1, "total_price": 1} for i in (1, 2, 3)])
+    monkeypatch.setattr(stock, "engine", engine)
+    return engine
+
+
+def _basket(*lines) -> stock.Basket:
+    basket = stock.Basket()
+    for good_id, style_id, count in lines:
+        basket.add(good_id, style_id, count, 0)
+    return basket
+
+
+def _sku(rdb, s: str) -> dict:
+    return {k.decode(): int(v) for k, v in rdb.hgetall(f"stock:sku:{s}").items()}
+
+
+def _stock(engine, model, id_: int) -> int:
+    with Session(engine) as db:
+        return db.execute(select(model.stock).where(model.id == id_)).scalar_one()
+
+
+def test_reserve_seeds_from_mysql(engine, rdb):
+    short_sku, deadline = stock.reserve(rdb, 1, _basket((1, None, 2), (2, 1, 1)))
+    assert short_sku is None
+    assert deadline.timestamp() > time.time()
+    assert _sku(rdb, "g1") == {"available": 3, "reserved": 2}
+    assert _sku(rdb, "s1") == {"available": 2, "reserved": 1}
+    assert rdb.zscore(stock.EXPIRY_KEY, 1) is not None
+
+
+def test_reserve_short_takes_nothing(engine, rdb):
+    short_sku, _ = stock.reserve(rdb, 1, _basket((1, None, 2), (2, 1, 4)))
+    assert short_sku == "s1"
+    assert _sku(rdb, "g1") == {"available": 5, "reserved": 0}
+    assert not rdb.exists("stock:res:1")
+    assert rdb.zscore(stock.EXPIRY_KEY, 1) is None
+
+
+def test_seed_skips_a_finished_write_back(engine, rdb):
+    # MySQL read before a write-back finished: the seed must not count those sales twice.
+    flushes = rdb.get(stock.FLUSHES_KEY) or b"0"
+    rdb.incr(stock.FLUSHES_KEY)
+    keys = ["stock:sku:g1", stock.SOLD_KEY, stock.SOLD_FLUSHING_KEY, stock.FLUSHES_KEY]
+    assert stock._call(rdb, stock._SET, keys, ["g1", 5, "init", flushes]) is None
+    assert not rdb.exists("stock:sku:g1")
+    stock._seed(rdb, ["g1"])
+    assert _sku(rdb, "g1") == {"available": 5, "reserved": 0}
+
+
+def test_confirm_and_flush(engine, rdb):
+    stock.reserve(rdb, 1, _basket((1, None, 2), (2, 1, 1)))
+    assert stock.confirm(rdb, 1) == {"g1": 2, "s1": 1}
+    assert stock.confirm(rdb, 1) == {}
+    assert _sku(rdb, "g1") == {"available": 3, "reserved": 0}
+    assert rdb.zscore(stock.EXPIRY_KEY, 1) is None
+    with Session(engine) as db:
+        assert stock.flush_sold(rdb, db) == 2
+    assert _stock(engine, Good, 1) == 3
+    assert _stock(engine, GoodStyle, 1) == 2
+    assert not rdb.exists(stock.SOLD_KEY, stock.SOLD_FLUSHING_KEY)
+    assert rdb.get(stock.FLUSHES_KEY) == b"1"
+    # Seeded after the write-back, from MySQL alone.
+    rdb.delete("stock:sku:g1")
+    stock.reserve(rdb, 2, _basket((1, None, 1)))
+    assert _sku(rdb, "g1") == {"available": 2, "reserved": 1}
+
+
+def test_unconfirm_after_flush(engine, rdb):
+    _, deadline = stock.reserve(rdb, 1, _basket((1, None, 2)))
+    items = stock.confirm(rdb, 1)
+    with Session(engine) as db:
+        stock.flush_sold(rdb, db)
+    stock.unconfirm(rdb, 1, items, deadline)
+    assert _sku(rdb, "g1") == {"available": 3, "reserved": 2}
+    assert rdb.zscore(stock.EXPIRY_KEY, 1) == pytest.approx(deadline.timestamp())
+    with Session(engine) as db:
+        stock.flush_sold(rdb, db)
+    assert _stock(engine, Good, 1) == 5
+    assert stock.release(rdb, 1)
+    assert _sku(rdb, "g1") == {"available": 5, "reserved": 0}
+
+
+def test_release(engine, rdb):
+    stock.reserve(rdb, 1, _basket((1, None, 2)))
+    assert stock.release(rdb, 1)
+    assert not stock.release(rdb, 1)
+    assert _sku(rdb, "g1") == {"available": 5, "reserved": 0}
+    assert not rdb.exists(stock.SOLD_KEY)
+
+
+def test_release_expired(engine, rdb):
+    stock.reserve(rdb, 1, _basket((1, None, 2)))
+    stock.reserve(rdb, 2, _basket((1, None, 1)))
+    rdb.zadd(stock.EXPIRY_KEY, {1: time.time() - 1})
+    with Session(engine) as db:
+        assert stock.release_expired(rdb, db) == 1
+        assert db.execute(select(Order.id, Order.status).order_by(Order.id)).all() == \
+            [(1, stock.ORDER_EXPIRED), (2, 0), (3, 0)]
+    assert _sku(rdb, "g1") == {"available": 4, "reserved": 1}
+    assert not stock.confirm(rdb, 1)